@@ -3,9 +3,17 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from django import forms
 from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Paginator
 from django.contrib import admin
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
+from django.utils.text import smart_split, unescape_string_literal
 import json
+import re
+import threading
+from collections import OrderedDict
 from .models import Empresa, SatRegistro, Documentos, LoginLog
 
 class UserCreationEmailForm(forms.ModelForm):
@@ -52,11 +60,30 @@ class CustomUserAdmin(BaseUserAdmin):
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
+_TERMO_CNPJ_RE = re.compile(r"[\d./-]*\d[\d./-]*")
+
 @admin.register(Empresa)
 class EmpresaAdmin(admin.ModelAdmin):
     list_display = ("nome", "cnpj")
     search_fields = ("nome", "cnpj")
     ordering = ("nome",)
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        # CNPJ (com ou sem máscara) vira busca por prefixo, que usa o índice de cnpj; termos
+        # numéricos curtos ("24" de "Posto 24 Horas") seguem a busca normal, que inclui o nome
+        termo = search_term.strip()
+        if _TERMO_CNPJ_RE.fullmatch(termo):
+            digitos = re.sub(r"\D", "", termo)
+            if len(digitos) >= 8:
+                return queryset.filter(Q(cnpj__startswith=termo) | Q(cnpj__startswith=digitos)), False
+        return super().get_search_results(request, queryset, search_term)
+
+# HTML de data_pretty por (pk, updated_at): o importador sempre grava updated_at,
+# então uma linha alterada gera uma chave nova e a antiga sai pelo LRU.
+_DATA_PRETTY_CACHE = OrderedDict()
+_DATA_PRETTY_MAX = 1024
+_DATA_PRETTY_LOCK = threading.Lock()
 
 @admin.register(SatRegistro)
 class SatRegistroAdmin(admin.ModelAdmin):
@@ -65,10 +92,8 @@ class SatRegistroAdmin(admin.ModelAdmin):
         "descricao", "ncm", "cfop", "cest", "cst_csosn",
         "created_at",
     )
-    search_fields = (
-        "empresa__nome", "empresa__cnpj",
-        "sheet", "descricao", "ncm", "cfop", "cest", "cst_csosn",
-    )
+    # só habilita a caixa de busca: os campos pesquisados estão em get_search_results
+    search_fields = ("descricao",)
     list_filter = ("sheet", "empresa")
     autocomplete_fields = ("empresa",)
     list_select_related = ("empresa",)
@@ -76,6 +101,31 @@ class SatRegistroAdmin(admin.ModelAdmin):
     ordering = ("-created_at",)
     readonly_fields = ("created_at", "updated_at", "data_pretty")
 
+    def get_search_results(self, request, queryset, search_term):
+        # Cada ramo do OR tem índice, então o PostgreSQL combina tudo num BitmapOr: empresas
+        # resolvidas antes como lista de pks (subconsulta/JOIN impediriam o BitmapOr), descrição
+        # pelo índice trigram de UPPER(descricao) e códigos fiscais por prefixo (índices _like).
+        # Termos separados como no admin padrão: "entre aspas" vira um termo só.
+        for termo in smart_split(search_term):
+            if termo.startswith(('"', "'")) and termo[0] == termo[-1]:
+                termo = unescape_string_literal(termo)
+            if not termo:
+                continue
+            empresas = list(
+                Empresa.objects.filter(Q(nome__icontains=termo) | Q(cnpj__icontains=termo))
+                .values_list("pk", flat=True)
+            )
+            filtro = Q(descricao__icontains=termo)
+            if empresas:
+                filtro |= Q(empresa_id__in=empresas)
+            if termo.isdigit():
+                filtro |= (
+                    Q(ncm__startswith=termo) | Q(cfop__startswith=termo)
+                    | Q(cest__startswith=termo) | Q(cst_csosn__startswith=termo)
+                )
+            queryset = queryset.filter(filtro)
+        return queryset, False
+
     fieldsets = (
         (None, {"fields": ("empresa", "sheet", "row")}),
         ("Chaves de pesquisa", {"fields": ("descricao", "ncm", "cfop", "cest", "cst_csosn")}),
@@ -84,13 +134,69 @@ class SatRegistroAdmin(admin.ModelAdmin):
     )
 
     def data_pretty(self, obj):
+        key = (obj.pk, obj.updated_at)
+        if obj.pk is not None:
+            with _DATA_PRETTY_LOCK:
+                html = _DATA_PRETTY_CACHE.get(key)
+                if html is not None:
+                    _DATA_PRETTY_CACHE.move_to_end(key)
+                    return mark_safe(html)
         try:
             content = json.dumps(obj.data or {}, indent=2, ensure_ascii=False)
         except Exception:
             content = str(obj.data)
-        return mark_safe(f"<pre style='max-width:100%;white-space:pre-wrap;'>{content}</pre>")
+        html = f"<pre style='max-width:100%;white-space:pre-wrap;'>{content}</pre>"
+        if obj.pk is not None:
+            with _DATA_PRETTY_LOCK:
+                _DATA_PRETTY_CACHE[key] = html
+                if len(_DATA_PRETTY_CACHE) > _DATA_PRETTY_MAX:
+                    _DATA_PRETTY_CACHE.popitem(last=False)
+        return mark_safe(html)
     data_pretty.short_description = "Dados (JSON)"
 
+class _ContagemEstimadaPaginator(Paginator):
+    """Sem filtro/busca, usa a estimativa do PostgreSQL (pg_class.reltuples) no lugar do COUNT(*).
+
+    A estimativa só vale acima de LIMIAR_ESTIMATIVA linhas; abaixo disso o COUNT real é barato.
+    Como ela só é atualizada por ANALYZE/autovacuum, páginas além de num_pages não são erro.
+    """
+    LIMIAR_ESTIMATIVA = 100_000
+    contagem_estimada = False
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        conn = connections[qs.db]
+        if conn.vendor == "postgresql" and not qs.query.where:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [qs.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # reltuples fica em -1/0 enquanto a tabela não passou por ANALYZE
+            if row and row[0] > self.LIMIAR_ESTIMATIVA:
+                self.contagem_estimada = True
+                return row[0]
+        return super().count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # estimativa baixa: as últimas linhas reais ficam depois de num_pages
+            if self.contagem_estimada and int(number) > 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.contagem_estimada:
+            return super().page(number)
+        # sem cortar o fatiamento em count, que pode estar abaixo do real
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+
 @admin.register(Documentos)
 class DocumentosAdmin(admin.ModelAdmin):
     list_display = (
@@ -101,12 +207,15 @@ class DocumentosAdmin(admin.ModelAdmin):
     search_fields = (
         "empresa__nome", "empresa__cnpj",
         "chaveacesso", "cnpjdoemitente", "cpfdodestinatario", "cnpjdodestinatario",
-        "nomedoemitente", "nomedodestinatario", "numerodocumento", "serie",
+        "nomedoemitente", "nomedodestinatario",
     )
     list_filter = ("situacao", "ufemitente", "ufdestinatario")
     autocomplete_fields = ("empresa",)
     list_select_related = ("empresa",)
-    ordering = ("-dataemissao",) 
+    ordering = ("-dataemissao",)
+    list_per_page = 50
+    paginator = _ContagemEstimadaPaginator
+    show_full_result_count = False
 
 @admin.register(LoginLog)
 class LoginLogAdmin(admin.ModelAdmin):
@@ -116,3 +225,11 @@ class LoginLogAdmin(admin.ModelAdmin):
     date_hierarchy = "created_at"
     autocomplete_fields = ("user",)
     ordering = ("-created_at",)
+
+    def get_search_results(self, request, queryset, search_term):
+        # login_view grava o e-mail já em minúsculas: prefixo exato usa o índice de email.
+        # "@dominio" (todos de um domínio) não é prefixo e segue a busca normal.
+        termo = search_term.strip().lower()
+        if "@" in termo[1:] and " " not in termo:
+            return queryset.filter(email__startswith=termo), False
+        return super().get_search_results(request, queryset, search_term)
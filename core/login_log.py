@@ -0,0 +1,97 @@
+"""Gravação de LoginLog fora da requisição de login.
+
+login_view só enfileira; uma thread em segundo plano grava em lotes com bulk_create.
+"""
+import atexit
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import LoginLog
+
+LOTE_MAX = 500
+ESPERA_FLUSH = 2.0  # segundos
+
+_fila = queue.Queue(maxsize=10_000)
+_thread = None
+_lock = threading.Lock()
+_FIM = object()  # sentinela: o consumidor grava o lote em mãos e termina
+_descartados = 0
+
+
+def registrar(user, email: str, success: bool) -> None:
+    _garantir_thread()
+    item = LoginLog(user=user, email=email, success=success, created_at=timezone.now())
+    try:
+        _fila.put_nowait(item)
+    except queue.Full:
+        # sob enxurrada de tentativas o log é descartado em vez de segurar o login;
+        # o e-mail vem do formulário e não vai para o log do servidor
+        global _descartados
+        _descartados += 1
+        print(f"[WARN] Fila de LoginLog cheia; {_descartados} tentativa(s) de login não registrada(s)")
+
+
+def _garantir_thread() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_consumir, name="login-log", daemon=True)
+            _thread.start()
+
+
+def _consumir() -> None:
+    while True:
+        item = _fila.get()
+        if item is _FIM:
+            return
+        lote = [item]
+        fim = False
+        prazo = time.monotonic() + ESPERA_FLUSH
+        try:
+            while len(lote) < LOTE_MAX:
+                item = _fila.get(timeout=max(0.0, prazo - time.monotonic()))
+                if item is _FIM:
+                    fim = True
+                    break
+                lote.append(item)
+        except queue.Empty:
+            pass
+        _gravar(lote)
+        if fim:
+            return
+
+
+def _gravar(lote) -> None:
+    close_old_connections()
+    try:
+        LoginLog.objects.bulk_create(lote, batch_size=LOTE_MAX)
+    except Exception as e:
+        print(f"[ERRO LoginLog] {type(e).__name__}: {e}")
+
+
+@atexit.register
+def _esvaziar() -> None:
+    # primeiro o consumidor grava o lote que já tirou da fila; depois sai o que sobrou
+    thread = _thread
+    if thread is not None and thread.is_alive():
+        try:
+            _fila.put(_FIM, timeout=1.0)
+        except queue.Full:
+            pass
+        thread.join(timeout=ESPERA_FLUSH + 5.0)
+    lote = []
+    while True:
+        try:
+            item = _fila.get_nowait()
+        except queue.Empty:
+            break
+        if item is not _FIM:
+            lote.append(item)
+    if lote:
+        _gravar(lote)
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-15 09:12
+
+from django.db import migrations
+from django.db.models.functions import Lower
+
+
+def lower_emails(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    User.objects.exclude(email=Lower('email')).update(email=Lower('email'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0005_remove_satregistro_uniq_empresa_sheet_row_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(lower_emails, migrations.RunPython.noop),
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS auth_user_email_idx ON auth_user (email);',
+            'DROP INDEX IF EXISTS auth_user_email_idx;',
+        ),
+    ]
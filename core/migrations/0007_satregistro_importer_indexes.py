@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-15 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_lower_auth_user_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='satregistro',
+            index=models.Index(fields=['empresa', 'sheet', 'row'], name='sat_emp_sheet_row_idx'),
+        ),
+    ]
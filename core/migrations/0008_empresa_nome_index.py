@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-15 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_satregistro_importer_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='empresa',
+            name='nome',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='Razão social'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-15 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_empresa_nome_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satregistro',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=32, null=True, verbose_name='Hash do conteúdo'),
+        ),
+    ]
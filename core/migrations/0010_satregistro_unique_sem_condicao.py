@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-15 08:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_satregistro_content_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='satregistro',
+            name='uniq_emp_comp_sheet_row',
+        ),
+        migrations.AddConstraint(
+            model_name='satregistro',
+            constraint=models.UniqueConstraint(fields=('empresa', 'competencia', 'sheet', 'row'), name='uniq_emp_comp_sheet_row'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-15 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_satregistro_unique_sem_condicao'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentos',
+            name='chaveacesso',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='documentos',
+            name='cnpjdoemitente',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='documentos',
+            name='dataemissao',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+    ]
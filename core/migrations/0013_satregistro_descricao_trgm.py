@@ -0,0 +1,40 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# icontains no PostgreSQL vira UPPER(col::text) LIKE UPPER('%x%'); o índice precisa ser da mesma expressão.
+# Requer a extensão pg_trgm no servidor (pacote postgresql-contrib): sem ela a migração falha
+# no CREATE EXTENSION. Em outros bancos as duas operações não fazem nada.
+
+
+class CriarPgTrgm(TrigramExtension):
+    # o CreateExtension do Django só confere o banco ao aplicar; ao reverter tentaria o DROP em qualquer um
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def criar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS sat_descricao_trgm ON core_satregistro '
+        'USING gin ((UPPER(descricao::text)) gin_trgm_ops)'
+    )
+
+
+def remover_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS sat_descricao_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_loginlog_created_at_default'),
+    ]
+
+    operations = [
+        CriarPgTrgm(),
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
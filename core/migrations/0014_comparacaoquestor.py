@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-15 08:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_satregistro_descricao_trgm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComparacaoQuestor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(verbose_name='Resultado')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comparacoes_questor', to='core.empresa')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='comparacoes_questor', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Comparação SAT x Questor',
+                'verbose_name_plural': 'Comparações SAT x Questor',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
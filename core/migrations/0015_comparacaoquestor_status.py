@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-15 08:44
+
+from django.db import migrations, models
+
+
+def marcar_concluidas(apps, schema_editor):
+    # as linhas anteriores já guardavam resultados prontos
+    apps.get_model('core', 'ComparacaoQuestor').objects.update(status='concluida')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_comparacaoquestor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comparacaoquestor',
+            name='mensagem',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='comparacaoquestor',
+            name='status',
+            field=models.CharField(choices=[('processando', 'Processando'), ('concluida', 'Concluída'), ('erro', 'Erro')], default='processando', max_length=12),
+        ),
+        migrations.AlterField(
+            model_name='comparacaoquestor',
+            name='payload',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Resultado'),
+        ),
+        migrations.RunPython(marcar_concluidas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-15 14:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_comparacaoquestor_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comparacaoquestor',
+            name='arquivo_tmp',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='comparacaoquestor',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class LoginLog(models.Model):
     user = models.ForeignKey(
@@ -8,7 +9,8 @@ class LoginLog(models.Model):
     )
     email = models.EmailField(max_length=254, db_index=True)
     success = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # default em vez de auto_now_add: a gravação é adiada (core.login_log) e deve manter a hora da tentativa
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
@@ -24,7 +26,7 @@ class LoginLog(models.Model):
 
 
 class Empresa(models.Model):
-    nome = models.CharField('Razão social', max_length=255)
+    nome = models.CharField('Razão social', max_length=255, db_index=True)
     cnpj = models.CharField('CNPJ', max_length=18, unique=True)
 
     class Meta:
@@ -48,10 +50,10 @@ class Documentos(EmpresaOwnedModel):
     tipodocumento = models.CharField(max_length=255, blank=True, null=True)
     tipodeoperacaoentradaousaida = models.CharField(max_length=255, blank=True, null=True)
     situacao = models.CharField(max_length=255, blank=True, null=True)
-    chaveacesso = models.CharField(max_length=255, blank=True, null=True)
-    dataemissao = models.CharField(max_length=255, blank=True, null=True)
+    chaveacesso = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    dataemissao = models.CharField(max_length=255, blank=True, null=True, db_index=True)
     cnpjoucpfdoemitente = models.CharField(max_length=255, blank=True, null=True)
-    cnpjdoemitente = models.CharField(max_length=255, blank=True, null=True)
+    cnpjdoemitente = models.CharField(max_length=255, blank=True, null=True, db_index=True)
     cpfdoemitente = models.CharField(max_length=255, blank=True, null=True)
     nomedoemitente = models.CharField(max_length=255, blank=True, null=True)
     ufemitente = models.CharField(max_length=255, blank=True, null=True)
@@ -138,6 +140,7 @@ class SatRegistro(models.Model):
     cfop       = models.CharField(max_length=10,  null=True, blank=True, db_index=True)
     cest       = models.CharField(max_length=10,  null=True, blank=True, db_index=True)
     cst_csosn  = models.CharField(max_length=10,  null=True, blank=True, db_index=True)
+    content_hash = models.CharField("Hash do conteúdo", max_length=32, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -148,7 +151,6 @@ class SatRegistro(models.Model):
             models.UniqueConstraint(
                 fields=["empresa", "competencia", "sheet", "row"],
                 name="uniq_emp_comp_sheet_row",
-                condition=~Q(competencia__isnull=True),
             ),
         ]
         indexes = [
@@ -160,4 +162,38 @@ class SatRegistro(models.Model):
             models.Index(fields=["empresa", "cfop"]),
             models.Index(fields=["empresa", "cest"]),
             models.Index(fields=["empresa", "cst_csosn"]),
+            # busca do importador: filter(empresa, sheet, row__in=...) por lote
+            models.Index(fields=["empresa", "sheet", "row"], name="sat_emp_sheet_row_idx"),
         ]
+
+
+class ComparacaoQuestor(models.Model):
+    """Comparação SAT x Questor processada em segundo plano; a sessão guarda só o id."""
+
+    class Status(models.TextChoices):
+        PROCESSANDO = "processando", "Processando"
+        CONCLUIDA = "concluida", "Concluída"
+        ERRO = "erro", "Erro"
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name="comparacoes_questor")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True,
+        on_delete=models.CASCADE, related_name="comparacoes_questor",
+    )
+    status = models.CharField(max_length=12, choices=Status.choices, default=Status.PROCESSANDO)
+    # resumo exibido ao concluir, ou o motivo da falha
+    mensagem = models.TextField(blank=True, default="")
+    payload = models.JSONField("Resultado", default=dict, blank=True)
+    # cópia do upload lida pela thread; removida ao terminar ou ao dar a comparação por perdida
+    arquivo_tmp = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # pulso da thread enquanto processa
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Comparação SAT x Questor"
+        verbose_name_plural = "Comparações SAT x Questor"
+
+    def __str__(self):
+        return f"{self.empresa_id} - {self.created_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,9 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+
+@receiver(pre_save, sender=get_user_model())
+def normalizar_email_usuario(sender, instance, **kwargs):
+    # login_view busca o usuário por igualdade exata no e-mail
+    instance.email = (instance.email or "").strip().lower()
@@ -1,2 +1,304 @@
-from django.test import TestCase
+import io
+import math
+import random
+import re
+import unicodedata
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
+from django.contrib.auth import get_user_model
+from django.contrib.messages import get_messages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from openpyxl import Workbook, load_workbook
+
+from .models import Empresa, SatRegistro
+from .views import (
+    _ler_questor, _money_str, _parse_date_any, _parse_money_float, _slug, _slugify_field,
+)
+
+
+def _xlsx(*abas) -> bytes:
+    """Planilha .xlsx em memória; cada aba é (nome, linhas), cabeçalho primeiro."""
+    wb = Workbook()
+    wb.remove(wb.active)
+    for nome, linhas in abas:
+        ws = wb.create_sheet(nome)
+        for linha in linhas:
+            ws.append(linha)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+# Implementações anteriores às otimizações, usadas como referência nas comparações aleatórias
+
+_DT_FMTS_ANTIGOS = (
+    "%d/%m/%y","%d/%m/%Y","%Y-%m-%d","%d-%m-%Y","%d.%m.%Y",
+    "%Y-%m-%d %H:%M","%Y-%m-%d %H:%M:%S",
+    "%d/%m/%Y %H:%M","%d/%m/%Y %H:%M:%S",
+    "%d/%m/%y %H:%M","%d/%m/%y %H:%M:%S",
+)
+
+def _parse_date_antigo(s: str):
+    s = s.strip()
+    if not s:
+        return None
+    s_norm = s.replace("T", " ").replace("Z", "")
+    if "." in s_norm:
+        s_norm = s_norm.split(".")[0]
+    for fmt in _DT_FMTS_ANTIGOS:
+        try:
+            return datetime.strptime(s_norm, fmt).date()
+        except Exception:
+            continue
+    if s.isdigit() and 20000 <= int(s) <= 80000:
+        return date(1899, 12, 30) + timedelta(days=int(s))
+    return None
+
+def _slugify_field_antigo(name) -> str:
+    if name is None:
+        name = ""
+    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    name = re.sub(r"[^\w]+", "_", name.strip().lower()).strip("_")
+    if not name:
+        name = "campo"
+    if re.match(r"^\d", name):
+        name = f"col_{name}"
+    if name in {"class","def","return","yield","from","import","global",
+                "lambda","with","pass","raise","id","pk","model","objects"}:
+        name = f"{name}_field"
+    return name
+
+def _slug_antigo(s) -> str:
+    s = unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^\w]+", "_", s.strip().lower()).strip("_") or "campo"
+
+def _parse_money_float_antigo(v: str) -> float:
+    try:
+        return float(_money_str(v))
+    except ValueError:
+        return 0.0
+
+
+class ParseDateAnyTests(SimpleTestCase):
+    def test_formatos_aceitos(self):
+        dia = date(2024, 1, 15)
+        casos = {
+            "15/01/2024": dia,
+            "15/01/24": dia,
+            "15/01/69": date(1969, 1, 15),
+            "15/01/2024 10:30": dia,
+            "15/01/2024 10:30:45": dia,
+            "15/01/24 10:30": dia,
+            "15/01/24 10:30:45": dia,
+            "2024-01-15": dia,
+            "2024-01-15 10:30": dia,
+            "2024-01-15 10:30:45": dia,
+            "2024-01-15T10:30:45Z": dia,
+            "2024-01-15T10:30:45.123": dia,
+            "15-01-2024": dia,
+            " 15/01/2024 ": dia,
+            "45306": dia,
+            45306: dia,
+            45306.5: dia,
+            datetime(2024, 1, 15, 10, 30): dia,
+            dia: dia,
+        }
+        for valor, esperado in casos.items():
+            with self.subTest(valor=valor):
+                self.assertEqual(_parse_date_any(valor), esperado)
+
+    def test_valores_rejeitados(self):
+        for valor in (
+            None, "", "   ", "abc", "31/02/2024", "15/13/2024", "15/01/2024 24:00",
+            "15/01/2024 10:60", "15-01-2024 10:30", "2024/01/15", "15.01.2024",
+            "100", 100, 90000,
+        ):
+            with self.subTest(valor=valor):
+                self.assertIsNone(_parse_date_any(valor))
+
+    def test_igual_a_versao_com_strptime(self):
+        rnd = random.Random(20240115)
+        pecas = "0123456789/-.:T Z"
+        for _ in range(20_000):
+            if rnd.random() < 0.5:
+                d = date(1950, 1, 1) + timedelta(days=rnd.randrange(40_000))
+                fmt = rnd.choice(_DT_FMTS_ANTIGOS)
+                s = datetime(d.year, d.month, d.day, rnd.randrange(24), rnd.randrange(60),
+                             rnd.randrange(60)).strftime(fmt)
+                if rnd.random() < 0.3:
+                    i = rnd.randrange(len(s))
+                    s = s[:i] + rnd.choice(pecas) + s[i + 1:]
+            else:
+                s = "".join(rnd.choice(pecas) for _ in range(rnd.randrange(1, 20)))
+            with self.subTest(s=s):
+                self.assertEqual(_parse_date_any(s), _parse_date_antigo(s))
+
+
+class NormalizacaoTests(SimpleTestCase):
+    ALFABETO = (
+        "abcXYZ019 _-./#()ºª°"
+        "áàâãäéêíóôõöúüçñÁÀÂÃÉÊÍÓÔÕÚÇÑ"
+        "ŁłŒœßæÆøØđĐ"
+        "̧́̃"       # acentos combinantes
+        "ﬁ²½Ⅻ①ｶ"                    # compatibilidade
+    )
+
+    def test_slugify_field_igual_a_versao_nfkd(self):
+        rnd = random.Random(20)
+        for _ in range(20_000):
+            s = "".join(rnd.choice(self.ALFABETO) for _ in range(rnd.randrange(0, 16)))
+            with self.subTest(s=s):
+                self.assertEqual(_slugify_field(s), _slugify_field_antigo(s))
+                self.assertEqual(_slug(s), _slug_antigo(s))
+
+    def test_slugify_field_regras_de_campo(self):
+        self.assertEqual(_slugify_field(None), "campo")
+        self.assertEqual(_slugify_field("  "), "campo")
+        self.assertEqual(_slugify_field("2º Valor"), "col_2o_valor")
+        self.assertEqual(_slugify_field("ID"), "id_field")
+        self.assertEqual(_slugify_field("Data Emissão"), "data_emissao")
+
+    def test_parse_money_float_igual_ao_caminho_antigo(self):
+        rnd = random.Random(19)
+        pecas = "0123456789.,-R$ e"
+        for _ in range(20_000):
+            if rnd.random() < 0.5:
+                s = str(Decimal(rnd.randrange(-10**8, 10**8)).scaleb(-2))
+            else:
+                s = "".join(rnd.choice(pecas) for _ in range(rnd.randrange(1, 14)))
+            with self.subTest(s=s):
+                novo, antigo = _parse_money_float(s), _parse_money_float_antigo(s)
+                if math.isnan(antigo):
+                    self.assertTrue(math.isnan(novo))
+                else:
+                    self.assertEqual(novo, antigo)
+
+    def test_parse_money_float_formatos(self):
+        self.assertEqual(_parse_money_float("1234.50"), 1234.5)
+        self.assertEqual(_parse_money_float("1.234,50"), 1234.5)
+        self.assertEqual(_parse_money_float("R$ 1.234,50"), 1234.5)
+        self.assertEqual(_parse_money_float("1,234.50"), 1234.5)
+        self.assertEqual(_parse_money_float("12,5"), 12.5)
+        self.assertEqual(_parse_money_float(None), 0.0)
+        self.assertEqual(_parse_money_float("abc"), 0.0)
+        self.assertEqual(_parse_money_float(7), 7.0)
+
+
+class LerQuestorTests(SimpleTestCase):
+    CABECALHO = ["Documento", "Série", "Data Emissão", "Espécie", "Chave de Acesso",
+                 "Valor Contábil", "Valor ICMS"]
+    CHAVE_NFE = "35240112345678000199550010000003011234567890"
+    CHAVE_NFCE = "35240112345678000199650010000003021234567890"
+
+    def linhas(self):
+        d = datetime
+        return [
+            self.CABECALHO,
+            ["100", "1", d(2024, 1, 10), "NFC-e", None, "10,00", "1,80"],
+            ["100", "1", d(2024, 1, 20), "NFCE", None, 5.5, 0.99],
+            ["200", None, d(2024, 1, 15), "NFC-e", None, "7,25", 0],
+            [None, "1", d(2024, 1, 10), "NFC-e", None, "99,00", 10],       # sem número
+            ["   ", "1", d(2024, 1, 10), "NFC-e", None, "99,00", 10],      # número em branco
+            ["300", "1", d(2024, 1, 10), "NF-e", None, "50,00", 9],        # NF-e pela espécie
+            ["301", "1", d(2024, 1, 10), "55", None, "50,00", 9],          # NF-e pelo modelo 55
+            ["302", "1", d(2024, 1, 10), None, self.CHAVE_NFE, "50,00", 9],   # NF-e pela chave
+            ["303", "1", d(2024, 1, 10), None, self.CHAVE_NFCE, "3,00", 0],   # NFC-e pela chave
+            ["400", "1", d(2023, 12, 31), "NFC-e", None, "20,00", 3],      # antes do período
+            ["401", "1", d(2024, 2, 1), "NFC-e", None, "20,00", 3],        # depois do período
+            ["402", "1", d(2024, 1, 31), "NFC-e", None, "1,00", 0],        # último dia, entra
+            ["403", "1", None, "NFC-e", None, "4,00", 0],                  # sem data
+        ]
+
+    def ler(self, dt_ini=None, dt_fim=None):
+        wb = load_workbook(io.BytesIO(_xlsx(("Questor", self.linhas()))), data_only=True, read_only=True)
+        try:
+            return _ler_questor(wb.active.iter_rows(values_only=True), dt_ini, dt_fim)
+        finally:
+            wb.close()
+
+    def test_periodo(self):
+        (doc_raw, doc_dig, pair_raw, pair_dig), totais, meta = self.ler(date(2024, 1, 1), date(2024, 1, 31))
+
+        self.assertEqual(pair_raw, {"100|1": 1550, "303|1": 300, "402|1": 100})
+        self.assertEqual(pair_dig, pair_raw)
+        self.assertEqual(doc_raw, {"200": 725})
+        self.assertEqual(doc_dig, {"200": 725})
+        self.assertEqual(meta["linhas_lidas_total"], 13)
+        self.assertEqual(meta["linhas_lidas_periodo"], 5)
+        self.assertEqual((meta["col_num"], meta["col_val"], meta["col_serie"], meta["col_data"]),
+                         ("documento", "valor_contabil", "serie", "data_emissao"))
+        # "Valor Contábil" também é a coluna de valor da nota (candidato "valor")
+        self.assertEqual(totais["valor_total"], Decimal("26.75"))
+        self.assertEqual(totais["valor_icms"], Decimal("2.79"))
+        self.assertEqual(totais["bc_icms"], Decimal("0"))
+
+    def test_sem_periodo(self):
+        (doc_raw, _, pair_raw, _), totais, meta = self.ler()
+
+        self.assertEqual(pair_raw, {"100|1": 1550, "303|1": 300, "400|1": 2000,
+                                    "401|1": 2000, "402|1": 100, "403|1": 400})
+        self.assertEqual(doc_raw, {"200": 725})
+        self.assertEqual(meta["linhas_lidas_periodo"], 8)
+        self.assertEqual(totais["valor_icms"], Decimal("8.79"))
+
+    def test_planilha_sem_colunas(self):
+        with self.assertRaises(ValueError):
+            _ler_questor(iter([("Foo", "Bar"), (1, 2)]))
+        with self.assertRaises(ValueError):
+            _ler_questor(iter([]))
+
+
+class SatImportarTests(TestCase):
+    CABECALHO = ["Data Emissão", "Número", "Descrição", "NCM", "Valor"]
+
+    def setUp(self):
+        user = get_user_model().objects.create_user("u", "u@empresa.com", "senha")
+        self.client.force_login(user)
+        self.empresa = Empresa.objects.create(nome="Empresa", cnpj="12345678000199")
+
+    def importar(self, linhas, competencia=""):
+        arquivo = SimpleUploadedFile("sat.xlsx", _xlsx(("Vendas", [self.CABECALHO, *linhas])))
+        r = self.client.post(reverse("sat_importar"), {
+            "empresa_id": self.empresa.pk, "arquivo": arquivo, "competencia": competencia,
+        })
+        self.assertRedirects(r, reverse("painel_inicial"), fetch_redirect_response=False)
+        # o redirect não é seguido, então as mensagens das importações anteriores se acumulam
+        return [str(m) for m in get_messages(r.wsgi_request)][-1]
+
+    def linhas(self):
+        return [
+            [datetime(2024, 1, 10), "1", "Cerveja", "22030000", 10.5],
+            [datetime(2024, 2, 3), "2", "Água", "22011000", 3],
+            [None, "3", "Sem data", "22021000", 1],       # competência nula
+            [None, None, None, None, None],               # vazia
+        ]
+
+    def test_reimportacao_sem_mudancas_nao_regrava(self):
+        msg = self.importar(self.linhas())
+        self.assertIn("Criados: 3 • Atualizados: 0 • Inalterados: 0 • Ignorados vazios: 1", msg)
+        self.assertEqual(SatRegistro.objects.filter(content_hash__isnull=True).count(), 0)
+        antes = dict(SatRegistro.objects.values_list("row", "updated_at"))
+
+        msg = self.importar(self.linhas())
+        self.assertIn("Criados: 0 • Atualizados: 0 • Inalterados: 3 • Ignorados vazios: 1", msg)
+        self.assertEqual(dict(SatRegistro.objects.values_list("row", "updated_at")), antes)
+        self.assertEqual(SatRegistro.objects.count(), 3)
+
+    def test_reimportacao_com_mudancas(self):
+        self.importar(self.linhas())
+        linhas = self.linhas()
+        linhas[0][2] = "Cerveja lata"
+        linhas[2][2] = "Sem data (corrigido)"
+
+        msg = self.importar(linhas)
+        self.assertIn("Criados: 0 • Atualizados: 2 • Inalterados: 1", msg)
+        self.assertEqual(SatRegistro.objects.count(), 3)
+        reg = SatRegistro.objects.get(row=2)
+        self.assertEqual((reg.descricao, reg.competencia, reg.data_emissao),
+                         ("Cerveja lata", date(2024, 1, 1), date(2024, 1, 10)))
+        reg = SatRegistro.objects.get(row=4)
+        self.assertEqual((reg.descricao, reg.competencia), ("Sem data (corrigido)", None))
+        self.assertEqual(reg.data["valor"], 1)
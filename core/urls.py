@@ -9,6 +9,7 @@ urlpatterns = [
     path("questor/form/", views.comparar_questor_form, name="comparar_questor_form"),         
     path("questor/comparar/", views.comparar_questor, name="comparar_questor"),              
     path("questor/resultado/", views.comparar_questor_resultado, name="comparar_questor_resultado"),  
+    path("questor/status/", views.comparar_questor_status, name="comparar_questor_status"),
     path("questor/resultado.csv", views.comparar_questor_csv, name="comparar_questor_csv"),    
 
     path("", views.login_view, name="login"),
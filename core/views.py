@@ -1,139 +1,240 @@
-from decimal import Decimal, InvalidOperation
-import re, time, unicodedata
-from datetime import datetime, date, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from collections import defaultdict
+from functools import lru_cache
+from typing import NamedTuple
+import hashlib, json, os, re, tempfile, threading, time, unicodedata
+from datetime import datetime, date, time as dt_time, timedelta
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, get_user_model, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
-from django.http import HttpResponse
+from django.db import connection, transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
 from django.views.decorators.http import require_POST
 from openpyxl import load_workbook, Workbook
+from openpyxl.cell import Cell, WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.utils import get_column_letter
-from .models import Empresa, LoginLog, SatRegistro
+from . import login_log
+from .models import ComparacaoQuestor, Empresa, SatRegistro
+
+_SLUG_RE = re.compile(r"[^\w]+")
+_DIGITS_RE = re.compile(r"\D+")
+_LEADING_DIGIT_RE = re.compile(r"^\d")
+_NUM_BR_RE = re.compile(r"^\d{1,3}(\.\d{3})*,\d+$")
+_NUM_US_RE = re.compile(r"^\d{1,3}(,\d{3})*\.\d+$")
+_RESERVED_FIELDS = frozenset({
+    "class","def","return","yield","from","import","global",
+    "lambda","with","pass","raise","id","pk","model","objects",
+})
+
+# Resultado de NFKD + encode("ascii", "ignore") para cada caractere Latin-1/Latin Extended
+_ASCII_FOLD = str.maketrans({
+    c: unicodedata.normalize("NFKD", chr(c)).encode("ascii", "ignore").decode("ascii")
+    for c in range(0x80, 0x250)
+})
+
+def _to_ascii(s: str) -> str:
+    if s.isascii():
+        return s
+    t = s.translate(_ASCII_FOLD)
+    if t.isascii():
+        return t
+    return unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+
+@lru_cache(maxsize=4096, typed=True)
+def _slug(s: str) -> str:
+    s = _to_ascii(str(s))
+    return _SLUG_RE.sub("_", s.strip().lower()).strip("_") or "campo"
 
+@lru_cache(maxsize=2048, typed=True)
 def _slugify_field(name: str) -> str:
-    if name is None:
-        name = ""
-    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
-    name = re.sub(r"[^\w]+", "_", name.strip().lower()).strip("_")
-    if not name:
-        name = "campo"
-    if re.match(r"^\d", name):
+    # mesma normalização de _slug (e o mesmo cache), mais as regras de nome de campo
+    name = _slug("" if name is None else name)
+    if _LEADING_DIGIT_RE.match(name):
         name = f"col_{name}"
-    if name in {"class","def","return","yield","from","import","global",
-                "lambda","with","pass","raise","id","pk","model","objects"}:
+    if name in _RESERVED_FIELDS:
         name = f"{name}_field"
     return name
 
-def _slug(s: str) -> str:
-    s = unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode("ascii")
-    return re.sub(r"[^\w]+", "_", s.strip().lower()).strip("_") or "campo"
+class _Row(dict):
+    """Linha normalizada; guarda o índice de chaves em minúsculas após o primeiro uso."""
+    __slots__ = ("_lowmap",)
+
+    @property
+    def lowmap(self) -> dict:
+        try:
+            return self._lowmap
+        except AttributeError:
+            self._lowmap = {k.lower(): k for k in self}
+            return self._lowmap
 
 def _first_key(d: dict, candidates):
     for k in candidates:
         if k in d:
             return k
-    low_map = {k.lower(): k for k in d.keys()}
+    low_map = d.lowmap if isinstance(d, _Row) else {k.lower(): k for k in d.keys()}
+    for c in candidates:
+        k = low_map.get(c)
+        if k is not None:
+            return k
     for c in candidates:
         for klow, korig in low_map.items():
             if c in klow:
                 return korig
     return None
 
+def _money_str(v) -> str:
+    """Normaliza um valor monetário (BR ou US, com ou sem R$) para o formato 1234.56."""
+    s = str(v).strip().replace("R$", "").replace(" ", "")
+    if _NUM_BR_RE.match(s):
+        return s.replace(".", "").replace(",", ".")
+    if _NUM_US_RE.match(s):
+        return s.replace(",", "")
+    return s.replace(",", ".")
+
+# Resultados imutáveis (Decimal, date, tuplas de str): seguro compartilhar entre chamadas.
+# typed=True separa 1, 1.0 e True, que parseiam diferente.
+@lru_cache(maxsize=100_000, typed=True)
 def _parse_decimal(v):
     if v is None:
         return Decimal("0")
-    s = str(v).strip().replace("R$", "").replace(" ", "")
-    if re.match(r"^\d{1,3}(\.\d{3})*,\d+$", s):
-        s = s.replace(".", "").replace(",", ".")
-    elif re.match(r"^\d{1,3}(,\d{3})*\.\d+$", s):
-        s = s.replace(",", "")
-    else:
-        s = s.replace(",", ".")
+    if isinstance(v, int) and not isinstance(v, bool):
+        return Decimal(v)
+    if isinstance(v, float):
+        return Decimal(repr(v))
     try:
-        return Decimal(s)
+        return Decimal(_money_str(v))
     except InvalidOperation:
         return Decimal("0")
 
+@lru_cache(maxsize=100_000, typed=True)
+def _parse_centavos(v) -> int:
+    """Valor monetário em centavos inteiros, para somas no laço sem aritmética Decimal."""
+    d = _parse_decimal(v)
+    if not d.is_finite():
+        return 0
+    return int(d.scaleb(2).to_integral_value(rounding=ROUND_HALF_UP))
+
+def _centavos_para_decimal(c: int) -> Decimal:
+    return Decimal(c).scaleb(-2)
+
+def _parse_money_float(v) -> float:
+    """Como _parse_decimal, mas em float: só para exibição/exportação, nunca para somas."""
+    if v is None:
+        return 0.0
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return float(v)
+    try:
+        # o payload da comparação traz str(Decimal) ("1234.50"): float() direto resolve;
+        # só formatos com vírgula/R$ precisam de _money_str, e nele esse caso não muda nada
+        return float(v)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(_money_str(v))
+    except ValueError:
+        return 0.0
+
+
+CANDS_STATUS_SAT = ("situacao", "status", "status_nfce", "situacao_nfce")
+CANDS_VALOR_TOTAL_SAT = ("valornfe", "valor_total", "valortotal", "valor_total_nfe", "valor_nfce")
+CANDS_CHAVE = ("chaveacesso", "chave_de_acesso", "chave", "accesskey")
+CANDS_NUMERO_ID_SAT = ("numerodocumento", "numero", "numnfe", "numero_nfce")
+CANDS_SERIE_SAT = ("serie", "serienfe", "serie_nfce")
+CANDS_NUMERO_SAT = (
+    "cu_numerodocumento", "numerodocumento", "numero_documento",
+    "documento", "n_documento", "numnfe", "numero_nfce", "numero",
+)
+CANDS_ESPECIE = ("especie", "especie_documento", "tipo", "tipo_documento")
+CANDS_MODELO = (
+    "modelodocumento", "modelo_documento", "modelo", "mod",
+    "modelo_nf", "modelo_nfe", "modelo_nfce",
+)
 
 def _is_cancelado(txt: str) -> bool:
-    return bool(txt) and "cancel" in str(txt).strip().lower()
+    # recebe o status já normalizado por _extr_status_sat
+    return bool(txt) and "cancel" in txt
 
 def _extr_status_sat(d: dict) -> str:
-    k = _first_key(d, ["situacao", "status", "status_nfce", "situacao_nfce"])
+    k = _first_key(d, CANDS_STATUS_SAT)
     return str(d.get(k, "")).strip().lower() if k else ""
 
 def _extr_valor_total_sat(d: dict) -> Decimal:
-    k = _first_key(d, ["valornfe","valor_total","valortotal","valor_total_nfe","valor_nfce"])
+    k = _first_key(d, CANDS_VALOR_TOTAL_SAT)
     return _parse_decimal(d.get(k))
 
 def _extr_id_sat(d: dict) -> str:
-    for k in ["chaveacesso","chave_de_acesso","chave","accesskey"]:
-        if d.get(k):
+    for k in CANDS_CHAVE:
+        if d.get(k) is not None:
             return str(d[k])
-    num = d.get(_first_key(d, ["numerodocumento","numero","numnfe","numero_nfce"])) or ""
-    serie = d.get(_first_key(d, ["serie","serienfe","serie_nfce"])) or ""
+    num = _txt(d.get(_first_key(d, CANDS_NUMERO_ID_SAT)))
+    serie = _txt(d.get(_first_key(d, CANDS_SERIE_SAT)))
     return (f"Nº {num} • Série {serie}").strip(" •") or "(sem id)"
 
-def _numero_documento_sat(d: dict) -> str:
-    k = _first_key(d, ["cu_numerodocumento","numerodocumento","numero_documento",
-                       "documento","n_documento","numnfe","numero_nfce","numero"])
-    return (str(d.get(k)) if k and d.get(k) is not None else "").strip()
+def _txt(v) -> str:
+    return "" if v is None else str(v)
 
-def _digits_only(s: str) -> str:
-    return re.sub(r"\D+", "", s or "").strip()
+def _digits_only(s) -> str:
+    return _DIGITS_RE.sub("", _txt(s))
 
-def _norm_doc(s: str) -> tuple[str, str]:
-    raw = (s or "").strip().lower()
+@lru_cache(maxsize=100_000, typed=True)
+def _norm_doc(s) -> tuple[str, str]:
+    raw = _txt(s).strip().lower()
     digs = _digits_only(s)
     return raw, digs
 
-def _norm_pair(doc: str, serie: str) -> tuple[str, str]:
-    raw_doc = (doc or "").strip().lower()
-    raw_ser = (serie or "").strip().lower()
-    dig_doc = _digits_only(doc)
-    dig_ser = _digits_only(serie)
+@lru_cache(maxsize=100_000, typed=True)
+def _norm_pair(doc, serie) -> tuple[str, str]:
+    # o documento costuma já estar no cache de _norm_doc; cada valor é convertido uma vez só
+    raw_doc, dig_doc = _norm_doc(doc)
+    raw_ser, dig_ser = _norm_doc(serie)
     return f"{raw_doc}|{raw_ser}", f"{dig_doc}|{dig_ser}"
 
+# poucos valores distintos (espécie/modelo) se repetem em todas as linhas do Questor;
+# typed=True porque 65 e 65.0 normalizam diferente
+@lru_cache(maxsize=256, typed=True)
 def _norm_txt(s: str) -> str:
-    t = unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode("ascii")
+    t = _to_ascii(str(s))
     return t.lower().replace(" ", "").replace("-", "").replace(".", "")
 
-def _is_nfe_questor(d: dict) -> bool:
-    k_esp = _first_key(d, ["especie","especie_documento","tipo","tipo_documento"])
-    if k_esp:
-        v = _norm_txt(d.get(k_esp, ""))
+# espécie/modelo se repetem em quase todas as linhas: a decisão por par fica em cache
+# e a chave de acesso só é lida quando os dois não decidem
+@lru_cache(maxsize=256)
+def _nfe_por_especie_modelo(especie: str | None, modelo: str | None) -> bool | None:
+    """NF-e (modelo 55) pela espécie/modelo do Questor. None = coluna ausente no argumento;
+    no retorno, None = indecidido, cair na chave de acesso."""
+    if especie is not None:
+        v = _norm_txt(especie)
         if "nfce" in v or "nfc" in v or v == "65":
             return False
         if "nfe" in v or "nfeletronica" in v or v == "55":
             return True
-    k_mod = _first_key(d, ["modelodocumento","modelo_documento","modelo","mod",
-                           "modelo_nf","modelo_nfe","modelo_nfce"])
-    if k_mod:
-        v = _norm_txt(d.get(k_mod, ""))
+    if modelo is not None:
+        v = _norm_txt(modelo)
         if "65" in v or "nfce" in v or "nfc" in v:
             return False
         if "55" in v or "nfe" in v:
             return True
-    k_ch = _first_key(d, ["chaveacesso","chave_de_acesso","chave","accesskey"])
-    if k_ch:
-        digs = _digits_only(d.get(k_ch, ""))
+    return None
+
+def _nfe_por_chave(chave: str | None) -> bool:
+    if chave is not None:
+        digs = _digits_only(chave)
         if len(digs) >= 22:
-            modelo = digs[20:22]
-            if modelo == "55":
-                return True
-            if modelo == "65":
-                return False
+            return digs[20:22] == "55"
     return False
 
+_TOKENS_AUTORIZADO = ("autoriz", "aprov", "normal", "regular", "emitid")
+
 def _is_autorizado(txt: str) -> bool:
     t = (txt or "").strip().lower()
     if not t or _is_cancelado(t):
         return False
-    tokens = ["autoriz","aprov","normal","regular","emitid"]
-    return any(tok in t for tok in tokens)
+    return any(tok in t for tok in _TOKENS_AUTORIZADO)
 
 def _status_legivel(d: dict) -> str:
     s = _extr_status_sat(d)
@@ -143,13 +244,17 @@ def _status_legivel(d: dict) -> str:
         return "AUTORIZADA"
     return (s or "DESCONHECIDO").strip().upper()
 
-_DT_FMTS = (
-    "%d/%m/%y","%d/%m/%Y","%Y-%m-%d","%d-%m-%Y","%d.%m.%Y",
-    "%Y-%m-%d %H:%M","%Y-%m-%d %H:%M:%S",
-    "%d/%m/%Y %H:%M","%d/%m/%Y %H:%M:%S",
-    "%d/%m/%y %H:%M","%d/%m/%y %H:%M:%S"
+# Formatos aceitos (equivalentes aos antigos formatos de strptime):
+# dd/mm/aa[aa] [HH:MM[:SS]], aaaa-mm-dd [HH:MM[:SS]] e dd-mm-aaaa.
+# dd.mm.aaaa nunca chegava ao strptime: o corte da fração de segundo (".") vem antes, como aqui.
+# Como o %d do strptime, o dia aceita um dígito precedido de espaço (" 7/02/2024").
+_DATE_RE = re.compile(
+    r"^(?P<a>\d{1,4}| [1-9])(?P<sep>[-/.])(?P<b>\d{1,2})(?P=sep)(?P<c>\d{1,4}| [1-9])"
+    r"(?:\s+(?P<H>\d{1,2}):(?P<M>\d{1,2})(?::(?P<S>\d{1,2}))?)?$"
 )
+_EXCEL_EPOCH = date(1899, 12, 30)
 
+@lru_cache(maxsize=100_000, typed=True)
 def _parse_date_any(v) -> date | None:
     """Tenta converter qualquer valor em data de forma segura."""
     if v is None or v == "":
@@ -158,40 +263,52 @@ def _parse_date_any(v) -> date | None:
         return v
     if isinstance(v, datetime):
         return v.date()
+    if isinstance(v, (int, float)):
+        return _EXCEL_EPOCH + timedelta(days=v) if 20000 <= v <= 80000 else None
 
     s = str(v).strip()
     if not s:
         return None
+    if s.isdigit():
+        return _EXCEL_EPOCH + timedelta(days=int(s)) if 20000 <= int(s) <= 80000 else None
+
     s_norm = s.replace("T", " ").replace("Z", "")
     if "." in s_norm:
         s_norm = s_norm.split(".")[0]
 
-    for fmt in _DT_FMTS:
-        try:
-            return datetime.strptime(s_norm, fmt).date()
-        except Exception:
-            continue
-
+    m = _DATE_RE.match(s_norm)
+    if not m:
+        return None
+    a, sep, b, c = m.group("a", "sep", "b", "c")
+    com_hora = m.group("H") is not None
+    if com_hora:
+        if int(m.group("H")) > 23 or int(m.group("M")) > 59 or int(m.group("S") or 0) > 59:
+            return None
+    if sep == "-" and len(a) == 4 and len(c) <= 2:
+        y, mo, d = int(a), int(b), int(c)
+    elif len(a) <= 2 and (len(c) == 4 or (sep == "/" and len(c) == 2 and c[0] != " ")):
+        if com_hora and sep != "/":
+            return None
+        d, mo, y = int(a), int(b), int(c)
+        if len(c) == 2:
+            y += 2000 if y <= 68 else 1900
+    else:
+        return None
     try:
-        if isinstance(v, (int, float)):
-            base = date(1899, 12, 30)
-            return base + timedelta(days=float(v))
-        if s.isdigit() and 20000 <= int(s) <= 80000:
-            base = date(1899, 12, 30)
-            return base + timedelta(days=int(s))
-    except Exception:
+        return date(y, mo, d)
+    except ValueError:
         return None
 
-    return None
 
+CANDS_DATA_EMISSAO_SAT = (
+    "dataemissao","data_emissao","dt_emissao","emissao","emissao_data",
+    "dataemissaonf","data_emissao_nf","data","dtemissao",
+    "data_entrada_saida","data_entrada","data_saida","dt_entrada","dt_saida",
+    "dataentradasaida"
+)
 
 def _extr_data_emissao_dict(d: dict) -> date | None:
-    k = _first_key(d, [
-        "dataemissao","data_emissao","dt_emissao","emissao","emissao_data",
-        "dataemissaonf","data_emissao_nf","data","dtemissao",
-        "data_entrada_saida","data_entrada","data_saida","dt_entrada","dt_saida",
-        "dataentradasaida"
-    ])
+    k = _first_key(d, CANDS_DATA_EMISSAO_SAT)
     return _parse_date_any(d.get(k)) if k else None
 
 def _competencia_from_date(d: date | None) -> date | None:
@@ -217,19 +334,16 @@ def login_view(request):
         email = (request.POST.get('email') or '').strip().lower()
         password = request.POST.get('password') or ''
         user = None
-        try:
-            user = authenticate(request, email=email, password=password)
-        except TypeError:
-            user = None
-        if user is None and email and password:
-            User = get_user_model()
-            u = User.objects.filter(email__iexact=email).order_by('id').first()
-            if u:
-                user = authenticate(request, username=u.get_username(), password=password)
-        try:
-            LoginLog.objects.create(user=user if user else None, email=email, success=bool(user))
-        except Exception:
-            pass
+        # uma única verificação de senha por tentativa
+        if email and password:
+            if settings.AUTH_BACKEND_EMAIL:
+                user = authenticate(request, email=email, password=password)
+            else:
+                User = get_user_model()
+                username = User.objects.filter(email=email).values_list(User.USERNAME_FIELD, flat=True).first()
+                if username is not None:
+                    user = authenticate(request, username=username, password=password)
+        login_log.registrar(user, email, bool(user))
         if user is not None:
             if not user.is_active:
                 messages.error(request, 'Usuário inativo.')
@@ -252,6 +366,146 @@ def painel_inicial(request):
     empresas = Empresa.objects.all().order_by("nome")
     return render(request, "painel_inicial.html", {"empresas": empresas})
 
+SAT_UPDATE_FIELDS = [
+    "data", "descricao", "ncm", "cfop", "cest", "cst_csosn", "data_emissao", "competencia",
+    "content_hash", "updated_at",
+]
+
+SAT_UNIQUE_FIELDS = ["empresa", "competencia", "sheet", "row"]
+
+def _valor_celula(v):
+    """Valor da célula como vai para o JSON: números continuam números e datas viram ISO."""
+    if v is None or isinstance(v, (int, float)):
+        return v
+    if isinstance(v, (datetime, date, dt_time)):
+        return v.isoformat()
+    return str(v).strip() or None
+
+def _coluna_txt(d: dict, *keys) -> str | None:
+    for k in keys:
+        v = d.get(k)
+        if v is not None:
+            return str(v)
+    return None
+
+class _LinhaSat(NamedTuple):
+    """Linha lida da planilha SAT aguardando a classificação em criar/atualizar."""
+    sheet: str
+    row: int
+    data: dict
+    data_emissao: date | None
+    competencia: date | None
+
+def _content_hash(data: dict) -> str:
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.md5(payload.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+def _sat_upsert(regs, batch_size=500):
+    """INSERT ... ON CONFLICT DO UPDATE para linhas com competência definida."""
+    SatRegistro.objects.bulk_create(
+        regs,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=SAT_UNIQUE_FIELDS,
+        update_fields=[f for f in SAT_UPDATE_FIELDS if f not in SAT_UNIQUE_FIELDS],
+    )
+
+def _sat_bulk_update(regs, batch_size=500):
+    """Regrava registros SAT existentes.
+
+    No PostgreSQL os valores vão por COPY para uma tabela temporária e um único
+    UPDATE ... FROM aplica o lote; bulk_update repetiria o JSON em um CASE por campo.
+    """
+    if not regs:
+        return
+    if connection.vendor != "postgresql":
+        SatRegistro.objects.bulk_update(regs, fields=SAT_UPDATE_FIELDS, batch_size=batch_size)
+        return
+
+    tabela = connection.ops.quote_name(SatRegistro._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMP TABLE _sat_upd ("
+            " id bigint PRIMARY KEY, data jsonb, descricao text, ncm text, cfop text, cest text,"
+            " cst_csosn text, data_emissao date, competencia date, content_hash text, updated_at timestamptz"
+            ") ON COMMIT DROP"
+        )
+        with cursor.cursor.copy("COPY _sat_upd FROM STDIN") as copy:
+            for reg in regs:
+                copy.write_row((
+                    reg.pk, json.dumps(reg.data), reg.descricao, reg.ncm, reg.cfop, reg.cest,
+                    reg.cst_csosn, reg.data_emissao, reg.competencia, reg.content_hash, reg.updated_at,
+                ))
+        cursor.execute(
+            f"UPDATE {tabela} AS s SET"
+            " data = u.data, descricao = u.descricao, ncm = u.ncm, cfop = u.cfop, cest = u.cest,"
+            " cst_csosn = u.cst_csosn, data_emissao = u.data_emissao, competencia = u.competencia,"
+            " content_hash = u.content_hash, updated_at = u.updated_at"
+            " FROM _sat_upd AS u WHERE s.id = u.id"
+        )
+        cursor.execute("DROP TABLE _sat_upd")
+
+def _sat_gravar_lote(empresa, sheet_name, linhas, agora, batch_size):
+    """Grava um lote de linhas de uma aba; devolve (criados, atualizados, inalterados).
+
+    Os existentes são buscados só para as linhas do lote, então a memória fica
+    limitada ao lote e não ao tamanho da planilha.
+    """
+    # tuplas cruas: só a identidade e o hash são necessários, não instâncias do modelo
+    exist_map = {
+        (comp, row): (pk, content_hash)
+        for pk, comp, row, content_hash in SatRegistro.objects
+            .filter(empresa=empresa, sheet=sheet_name, row__in=[l.row for l in linhas])
+            .values_list("id", "competencia", "row", "content_hash")
+    }
+    criados = atualizados = inalterados = 0
+    to_upsert, to_create, to_update = [], [], []
+    for _, r, data, dt_em, competencia in linhas:
+        try:
+            content_hash = _content_hash(data)
+            existente = exist_map.get((competencia, r))
+            if existente is not None:
+                if existente[1] == content_hash:
+                    inalterados += 1
+                    continue
+                atualizados += 1
+            else:
+                criados += 1
+
+            obj = SatRegistro(
+                empresa=empresa,
+                sheet=sheet_name,
+                row=r,
+                data=data,
+                descricao=_coluna_txt(data, "descricao", "descricao_produto", "descricao_mercadoria"),
+                ncm=_coluna_txt(data, "ncm"),
+                cfop=_coluna_txt(data, "cfop"),
+                cest=_coluna_txt(data, "cest"),
+                cst_csosn=_coluna_txt(data, "cst_csosn", "cst", "csosn"),
+                data_emissao=dt_em,
+                competencia=competencia,
+                content_hash=content_hash,
+            )
+            if competencia is not None:
+                to_upsert.append(obj)
+            elif existente is not None:
+                obj.pk = existente[0]
+                obj.updated_at = agora
+                to_update.append(obj)
+            else:
+                to_create.append(obj)
+        except Exception as e:
+            print(f"[WARN] Falha linha {r} da aba {sheet_name}: {e}")
+            continue
+
+    if to_upsert:
+        _sat_upsert(to_upsert, batch_size=batch_size)
+    if to_create:
+        SatRegistro.objects.bulk_create(to_create, batch_size=batch_size, ignore_conflicts=True)
+    if to_update:
+        _sat_bulk_update(to_update, batch_size=batch_size)
+    return criados, atualizados, inalterados
+
 @login_required
 @require_POST
 def sat_importar(request):
@@ -269,117 +523,61 @@ def sat_importar(request):
     empresa = get_object_or_404(Empresa, pk=empresa_id)
 
     try:
-        wb = load_workbook(filename=arquivo, data_only=True, read_only=True)
+        wb = load_workbook(filename=arquivo, data_only=True, read_only=True, keep_links=False)
     except Exception as e:
         messages.error(request, f"Falha ao abrir o Excel: {e}")
         return redirect("painel_inicial")
 
     inicio = time.time()
-    criados = atualizados = ignorados_vazios = 0
-    to_create = []
-    to_update = []
+    criados = atualizados = inalterados = ignorados_vazios = 0
     BATCH = 500
-
-    try:
-        exist_map = {
-            (empresa.id, reg.competencia, reg.sheet, reg.row): reg
-            for reg in SatRegistro.objects.filter(empresa=empresa).only("id", "competencia", "sheet", "row")
-        }
-    except Exception as e:
-        messages.error(request, f"Erro ao consultar registros existentes: {e}")
-        return redirect("painel_inicial")
+    agora = timezone.now()
 
     try:
         for sheet_name in wb.sheetnames:
             ws = wb[sheet_name]
-            rows = ws.iter_rows(values_only=True)
-            try:
-                headers = next(rows)
-            except StopIteration:
+            headers = next(ws.iter_rows(max_row=1, values_only=True), None)
+            if headers is None:
                 continue
 
             header_keys = [_slugify_field(h) for h in headers]
+            # com max_col o openpyxl já entrega cada linha com exatamente len(headers) células
+            rows = ws.iter_rows(min_row=2, max_col=len(headers), values_only=True)
 
+            # no máximo BATCH linhas em memória: cada lote consulta os existentes e é gravado
+            pendentes = []
             for r, row in enumerate(rows, start=2):
                 try:
-                    data, vazio = {}, True
-                    for i, key in enumerate(header_keys):
-                        val = row[i] if i < len(row) else None
-                        if val not in (None, ""):
-                            vazio = False
-                        data[key] = None if val in (None, "") else str(val)
-
-                    if vazio:
+                    # any() resolve quase toda linha na primeira célula; a contagem só roda
+                    # quando nada é verdadeiro (ex.: linha só com zeros não é vazia)
+                    if not any(row) and row.count(None) + row.count("") == len(row):
                         ignorados_vazios += 1
                         continue
 
-                    desc = (data.get("descricao") or data.get("descricao_produto") or data.get("descricao_mercadoria"))
-                    cst = (data.get("cst_csosn") or data.get("cst") or data.get("csosn"))
+                    data = _Row({k: _valor_celula(v) for k, v in zip(header_keys, row)})
+
                     dt_em = _extr_data_emissao_dict(data)
                     competencia = _competencia_from_date(dt_em) or comp_param
-                    unique_key = (empresa.id, competencia, sheet_name, r)
-
-                    if unique_key in exist_map:
-                        reg = exist_map[unique_key]
-                        reg.data = data
-                        reg.descricao = desc
-                        reg.ncm = data.get("ncm")
-                        reg.cfop = data.get("cfop")
-                        reg.cest = data.get("cest")
-                        reg.cst_csosn = cst
-                        reg.data_emissao = dt_em
-                        reg.competencia = competencia
-                        to_update.append(reg)
-                        atualizados += 1
-                    else:
-                        obj = SatRegistro(
-                            empresa=empresa,
-                            sheet=sheet_name,
-                            row=r,
-                            data=data,
-                            descricao=desc,
-                            ncm=data.get("ncm"),
-                            cfop=data.get("cfop"),
-                            cest=data.get("cest"),
-                            cst_csosn=cst,
-                            data_emissao=dt_em,
-                            competencia=competencia,
-                        )
-                        to_create.append(obj)
-                        criados += 1
-                        exist_map[unique_key] = obj
-
-                    if len(to_create) >= BATCH:
-                        SatRegistro.objects.bulk_create(to_create, batch_size=BATCH, ignore_conflicts=True)
-                        to_create.clear()
-                    
-                    if len(to_update) >= BATCH:
-                        SatRegistro.objects.bulk_update(
-                            to_update,
-                            fields=["data", "descricao", "ncm", "cfop", "cest", "cst_csosn", "data_emissao", "competencia"],
-                            batch_size=BATCH,
-                        )
-                        to_update.clear()
-                        
+                    pendentes.append(_LinhaSat(sheet_name, r, data, dt_em, competencia))
                 except Exception as e:
                     print(f"[WARN] Falha linha {r} da aba {sheet_name}: {e}")
                     continue
 
-        if to_create:
-            SatRegistro.objects.bulk_create(to_create, batch_size=BATCH, ignore_conflicts=True)
-        
-        if to_update:
-            SatRegistro.objects.bulk_update(
-                to_update,
-                fields=["data", "descricao", "ncm", "cfop", "cest", "cst_csosn", "data_emissao", "competencia"],
-                batch_size=BATCH,
-            )
+                if len(pendentes) >= BATCH:
+                    n_cri, n_atu, n_ina = _sat_gravar_lote(empresa, sheet_name, pendentes, agora, BATCH)
+                    criados, atualizados, inalterados = criados + n_cri, atualizados + n_atu, inalterados + n_ina
+                    pendentes.clear()
+
+            if pendentes:
+                n_cri, n_atu, n_ina = _sat_gravar_lote(empresa, sheet_name, pendentes, agora, BATCH)
+                criados, atualizados, inalterados = criados + n_cri, atualizados + n_atu, inalterados + n_ina
 
         duracao = round(time.time() - inicio, 2)
         messages.success(
             request,
             f"Importação concluída para '{empresa.nome}'. "
-            f"Criados: {criados} • Atualizados: {atualizados} • Ignorados vazios: {ignorados_vazios} • Tempo: {duracao}s."
+            f"Criados: {criados} • Atualizados: {atualizados} • Inalterados: {inalterados} • "
+            f"Ignorados vazios: {ignorados_vazios} • Tempo: {duracao}s."
         )
 
     except Exception as e:
@@ -401,13 +599,59 @@ def comparar_questor_form(request):
         "fim_default": fim_default,
     })
 
+# a thread atualiza updated_at a cada PULSO_LINHAS linhas lidas (Questor e SAT); uma comparação
+# "processando" sem pulso há mais que PRAZO_COMPARACAO perdeu a thread (ex.: reinício do servidor)
+PULSO_LINHAS = 2000
+PRAZO_COMPARACAO = timedelta(minutes=5)
+
+def _descartar_tmp(caminho: str) -> None:
+    if not caminho:
+        return
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+def _comparacao_da_sessao(request, com_payload: bool = True) -> ComparacaoQuestor | None:
+    cmp_id = request.session.get("questor_cmp_id")
+    if not cmp_id:
+        return None
+    qs = ComparacaoQuestor.objects.filter(pk=cmp_id, user=request.user)
+    if not com_payload:
+        qs = qs.defer("payload")
+    cmp = qs.first()
+    if (cmp and cmp.status == ComparacaoQuestor.Status.PROCESSANDO
+            and cmp.updated_at < timezone.now() - PRAZO_COMPARACAO):
+        # o finally da thread não vai rodar: a cópia do upload sai aqui
+        _descartar_tmp(cmp.arquivo_tmp)
+        cmp.status = ComparacaoQuestor.Status.ERRO
+        cmp.mensagem = "A comparação foi interrompida antes de terminar. Envie a planilha novamente."
+        cmp.arquivo_tmp = ""
+        cmp.save(update_fields=["status", "mensagem", "arquivo_tmp", "updated_at"])
+    return cmp
+
+@login_required
+def comparar_questor_status(request):
+    cmp = _comparacao_da_sessao(request, com_payload=False)
+    return JsonResponse({"status": cmp.status if cmp else ComparacaoQuestor.Status.ERRO})
+
 @login_required
 def comparar_questor_resultado(request):
-    data = request.session.get("questor_cmp")
-    if not data:
+    cmp = _comparacao_da_sessao(request)
+    if not cmp:
         messages.error(request, "Nenhum resultado para exibir. Envie a planilha do Questor primeiro.")
         return redirect("comparar_questor_form")
+    if cmp.status == ComparacaoQuestor.Status.PROCESSANDO:
+        return render(request, "comparar_questor_processando.html", {"empresa": cmp.empresa})
+    if cmp.status == ComparacaoQuestor.Status.ERRO:
+        messages.error(request, cmp.mensagem)
+        request.session.pop("questor_cmp_id", None)
+        request.session.pop("questor_cmp_aviso", None)
+        return redirect("comparar_questor_form")
+    if request.session.pop("questor_cmp_aviso", None) == cmp.pk:
+        messages.success(request, cmp.mensagem)
 
+    data = cmp.payload
     empresa = get_object_or_404(Empresa, pk=data["empresa_id"])
     erros = data.get("resultado", [])
 
@@ -432,95 +676,119 @@ def comparar_questor_resultado(request):
     })
 
 
-def _row_to_norm_dict(headers, row):
-    d = { _slug(h): (row[i] if i < len(row) else None) for i, h in enumerate(headers) }
-    return {k: ("" if v is None else str(v).strip()) for k, v in d.items()}
-
-CANDS_VALOR_NOTA = [
+CANDS_VALOR_NOTA = (
     "valor_total_nota","valor_total_notas","valor_total","valortotal","vl_total","valor",
     "valornfe","valor_nfce","valor_total_nfe",
     "valortotalnota", "valor_totalnota"  
-]
+)
 
-CANDS_BC_ICMS = [
+CANDS_BC_ICMS = (
     "bc_icms","base_icms","base_de_calculo_icms","basecalc_icms","valor_bc_icms","basecalculo_icms",
     "valorbasecalculoicms", "vbc"  
-]
+)
 
-CANDS_VALOR_ICMS = [
+CANDS_VALOR_ICMS = (
     "valor_icms","vl_icms","vlr_icms","valor_do_icms","vlicms","v_icms",
     "valortotalicms","valor_total_icms"  
-]
+)
 
+CANDS_NUM_QUESTOR = ("cu_numerodocumento","numerodocumento","numero_documento","n_documento","documento","numero")
+CANDS_VALOR_CONTABIL = ("valor_contabil","valorcontabil","vl_contabil","vlr_contabil","valor_total","valortotal","vl_total","valor")
+CANDS_SERIE_QUESTOR = ("serie","serie_documento","serienfe","serie_nfce")
+CANDS_DATA_QUESTOR = (
+    "dataemissao","data_emissao","dt_emissao","emissao","emissao_data",
+    "data","dtemissao",
+    "data_entrada_saida","data_entrada","data_saida","dt_entrada","dt_saida",
+    "dataentradasaida"
+)
 
-def _extr_decimal_by_keys(d: dict, candidates) -> Decimal:
-    k = _first_key(d, candidates)
-    return _parse_decimal(d.get(k)) if k else Decimal("0")
+def _celula_txt(row, i: int | None) -> str | None:
+    if i is None:
+        return None
+    v = row[i] if i < len(row) else None
+    return "" if v is None else str(v).strip()
 
-def _questor_map_por_documento(ws, dt_ini: date | None = None, dt_fim: date | None = None):
-    rows = ws.iter_rows(values_only=True)
-    headers = next(rows)
-    cols = { _slug(h): i for i, h in enumerate(headers) }
+def _celula(row, i: int | None):
+    return row[i] if i is not None and i < len(row) else None
 
-    cand_num = ["cu_numerodocumento","numerodocumento","numero_documento","n_documento","documento","numero"]
-    cand_val = ["valor_contabil","valorcontabil","vl_contabil","vlr_contabil","valor_total","valortotal","vl_total","valor"]
-    cand_ser = ["serie","serie_documento","serienfe","serie_nfce"]
-    cand_dt  = [
-        "dataemissao","data_emissao","dt_emissao","emissao","emissao_data",
-        "data","dtemissao",
-        "data_entrada_saida","data_entrada","data_saida","dt_entrada","dt_saida",
-        "dataentradasaida"
-    ]
+def _ler_questor(rows, dt_ini: date | None = None, dt_fim: date | None = None):
+    """Uma passada na planilha do Questor: mapas de valor contábil por documento (em centavos)
+    e totais do período (Decimal). `rows` é qualquer iterável de tuplas, cabeçalho primeiro."""
+    rows = iter(rows)
+    headers = next(rows, None)
+    if headers is None:
+        raise ValueError("A planilha do Questor está vazia.")
+    cols = _Row((_slug(h), i) for i, h in enumerate(headers))
 
-    k_num = _first_key(cols, cand_num)
-    k_val = _first_key(cols, cand_val)
-    k_ser = _first_key(cols, cand_ser)
-    k_dt  = _first_key(cols, cand_dt)
+    k_num = _first_key(cols, CANDS_NUM_QUESTOR)
+    k_val = _first_key(cols, CANDS_VALOR_CONTABIL)
 
     if not (k_num and k_val):
         raise ValueError("Planilha do Questor sem colunas NumeroDocumento/Valor Contábil (ou Valor Total).")
 
-    doc_exato, doc_digits = {}, {}
-    pair_exato, pair_digits = {}, {}
+    def _idx(candidates):
+        k = _first_key(cols, candidates)
+        return (k, cols[k]) if k else (None, None)
+
+    k_ser, i_ser = _idx(CANDS_SERIE_QUESTOR)
+    k_dt, i_dt = _idx(CANDS_DATA_QUESTOR)
+    _, i_esp = _idx(CANDS_ESPECIE)
+    _, i_mod = _idx(CANDS_MODELO)
+    _, i_ch = _idx(CANDS_CHAVE)
+    _, i_nota = _idx(CANDS_VALOR_NOTA)
+    _, i_bc = _idx(CANDS_BC_ICMS)
+    _, i_icms = _idx(CANDS_VALOR_ICMS)
+    i_num, i_val = cols[k_num], cols[k_val]
+
+    por_doc = defaultdict(int)  # (numero, serie) brutos -> centavos
+    tot_nota = tot_bc = tot_icms = 0
 
     lidas_total = 0
     lidas_periodo = 0
 
-    for _r, row in enumerate(rows, start=2):
+    for row in rows:
         lidas_total += 1
 
-        dt_row = None
-        if k_dt is not None and cols[k_dt] < len(row):
-            dt_row = _parse_date_any(row[cols[k_dt]])
+        # do mais barato ao mais caro: linhas sem número (em branco, rodapés) nem chegam
+        # à data e ao teste de NF-e
+        num_txt = _txt(_celula(row, i_num))
+        if not num_txt.strip():
+            continue
+
         if dt_ini and dt_fim:
+            dt_row = _parse_date_any(_celula(row, i_dt))
             if dt_row is None or not (dt_ini <= dt_row <= dt_fim):
                 continue
 
-        dline = _row_to_norm_dict(headers, row)
-        if _is_nfe_questor(dline):
+        nfe = _nfe_por_especie_modelo(_celula_txt(row, i_esp), _celula_txt(row, i_mod))
+        if nfe is None:
+            nfe = _nfe_por_chave(_celula_txt(row, i_ch))
+        if nfe:
             continue
 
         lidas_periodo += 1
 
-        raw_num = row[cols[k_num]] if cols[k_num] < len(row) and row[cols[k_num]] is not None else ""
-        if str(raw_num).strip() == "":
-            continue
-
-        val_q = _parse_decimal(row[cols[k_val]] if cols[k_val] < len(row) else "0")
-        serie = ""
-        if k_ser is not None and cols[k_ser] < len(row):
-            v = row[cols[k_ser]]
-            serie = "" if v is None else str(v)
+        # soma por chave bruta; a normalização roda uma vez por documento, não por linha
+        por_doc[(num_txt, _txt(_celula(row, i_ser)))] += _parse_centavos(row[i_val] if i_val < len(row) else "0")
 
-        doc_raw, doc_dig = _norm_doc(str(raw_num))
-        key_pair_raw, key_pair_dig = _norm_pair(str(raw_num), serie)
+        if i_nota is not None:
+            tot_nota += _parse_centavos(_celula(row, i_nota))
+        if i_bc is not None:
+            tot_bc += _parse_centavos(_celula(row, i_bc))
+        if i_icms is not None:
+            tot_icms += _parse_centavos(_celula(row, i_icms))
 
+    doc_exato, doc_digits = defaultdict(int), defaultdict(int)
+    pair_exato, pair_digits = defaultdict(int), defaultdict(int)
+    for (num_txt, serie), val_q in por_doc.items():
         if serie:
-            pair_exato[key_pair_raw]  = pair_exato.get(key_pair_raw,  Decimal("0")) + val_q
-            pair_digits[key_pair_dig] = pair_digits.get(key_pair_dig, Decimal("0")) + val_q
+            key_pair_raw, key_pair_dig = _norm_pair(num_txt, serie)
+            pair_exato[key_pair_raw]  += val_q
+            pair_digits[key_pair_dig] += val_q
         else:
-            doc_exato[doc_raw]  = doc_exato.get(doc_raw,  Decimal("0")) + val_q
-            doc_digits[doc_dig] = doc_digits.get(doc_dig, Decimal("0")) + val_q
+            doc_raw, doc_dig = _norm_doc(num_txt)
+            doc_exato[doc_raw]  += val_q
+            doc_digits[doc_dig] += val_q
 
     meta = {
         "linhas_lidas_total": lidas_total,
@@ -530,86 +798,153 @@ def _questor_map_por_documento(ws, dt_ini: date | None = None, dt_fim: date | No
         "col_serie": k_ser or "",
         "col_data": k_dt or "",
     }
-    return (doc_exato, doc_digits, pair_exato, pair_digits), meta
-
-
-def _questor_totais_periodo(ws, dt_ini: date | None, dt_fim: date | None) -> dict:
-    rows = ws.iter_rows(values_only=True)
-    headers = next(rows)
-    cols = { _slug(h): i for i, h in enumerate(headers) }
-
-    k_num = _first_key(cols, ["cu_numerodocumento","numerodocumento","numero_documento","n_documento","documento","numero"])
-    k_ser = _first_key(cols, ["serie","serie_documento","serienfe","serie_nfce"])
-    k_dt  = _first_key(cols, [
-        "dataemissao","data_emissao","dt_emissao","emissao","emissao_data",
-        "data","dtemissao","data_entrada_saida","data_entrada","data_saida","dt_entrada","dt_saida","dataentradasaida"
-    ])
-
-    if not k_num:
-        return {"valor_total": Decimal("0"), "bc_icms": Decimal("0"), "valor_icms": Decimal("0")}
-
-    por_doc_valor, por_doc_bc, por_doc_icms = {}, {}, {}
+    totais = {
+        "valor_total": _centavos_para_decimal(tot_nota),
+        "bc_icms": _centavos_para_decimal(tot_bc),
+        "valor_icms": _centavos_para_decimal(tot_icms),
+    }
+    # dict simples na saída: um acesso por [] não pode criar chave nova depois
+    return (dict(doc_exato), dict(doc_digits), dict(pair_exato), dict(pair_digits)), totais, meta
+
+class _EsquemaSat(NamedTuple):
+    """Chaves do JSON SAT já resolvidas por _first_key para um conjunto de colunas."""
+    data_emissao: str | None
+    numero: str | None
+    serie: str | None
+    status: str | None
+    valor_nota: str | None
+    bc_icms: str | None
+    valor_icms: str | None
+
+@lru_cache(maxsize=256)
+def _esquema_sat(chaves: tuple) -> _EsquemaSat:
+    # as linhas de uma mesma planilha compartilham as chaves; a resolução roda uma vez por esquema
+    d = _Row(dict.fromkeys(chaves))
+    return _EsquemaSat(*(_first_key(d, c) for c in (
+        CANDS_DATA_EMISSAO_SAT, CANDS_NUMERO_SAT, CANDS_SERIE_SAT, CANDS_STATUS_SAT,
+        CANDS_VALOR_NOTA, CANDS_BC_ICMS, CANDS_VALOR_ICMS,
+    )))
+
+# linhas guardadas por lista no resultado; além disso só os totais são contados
+MAX_LINHAS_RESULTADO = 20_000
+
+def _com_pulso(linhas, pulso=None):
+    """Repassa `linhas` chamando `pulso()` a cada PULSO_LINHAS itens."""
+    if pulso is None:
+        yield from linhas
+        return
+    for i, linha in enumerate(linhas, 1):
+        if i % PULSO_LINHAS == 0:
+            pulso()
+        yield linha
+
+def _varrer_sat(qs, dt_ini: date | None, dt_fim: date | None, q_maps, chaves_questor: set,
+                pulso=None) -> dict:
+    """Uma passada nos registros SAT: totais do período, canceladas com valor no Questor e
+    autorizadas ausentes do Questor. Cada linha tem o JSON lido e as chaves normalizadas uma vez.
+    `qs` é um values_list("data", "sheet", "row")."""
+    q_doc_raw, q_doc_dig, q_pair_raw, q_pair_dig = q_maps
+
+    tot_valor = tot_bc = tot_icms = 0
+    vistos = set()
+    divergencias = []
+    autorizadas_fora = []
+    divergencias_total = autorizadas_fora_total = 0
+    vistos_aut = set()
+    candidatos = pareadas = nao_encontradas = 0
+    sat_considerados = 0
+    sat_total_periodo = 0
 
-    for row in rows:
+    for data, sheet, row in _com_pulso(qs.iterator(chunk_size=2000), pulso):
+        d = data or {}
+        ks = _esquema_sat(tuple(d))
+        dt_em = _parse_date_any(d.get(ks.data_emissao)) if ks.data_emissao else None
         if dt_ini and dt_fim:
-            if k_dt is None or cols[k_dt] >= len(row):
-                continue
-            dt_row = _parse_date_any(row[cols[k_dt]])
-            if dt_row is None or not (dt_ini <= dt_row <= dt_fim):
+            if dt_em is None or not (dt_ini <= dt_em <= dt_fim):
                 continue
-
-        dline = _row_to_norm_dict(headers, row)
-        if _is_nfe_questor(dline):
-            continue
-
-        num = row[cols[k_num]] if cols[k_num] < len(row) else ""
-        if str(num).strip() == "":
+        sat_total_periodo += 1
+        num_sat = _txt(d.get(ks.numero) if ks.numero else None).strip()
+        if not num_sat:
             continue
+        serie_sat = _txt(d.get(ks.serie))
+        raw_doc, dig_doc = _norm_doc(num_sat)
+        key_pair_raw, key_pair_dig = _norm_pair(num_sat, serie_sat)
 
-        serie = ""
-        if k_ser is not None and cols[k_ser] < len(row):
-            s = row[cols[k_ser]]
-            serie = "" if s is None else str(s)
-
-        key_raw, _ = _norm_pair(str(num), serie)
+        if key_pair_raw not in vistos:
+            vistos.add(key_pair_raw)
+            tot_valor += _parse_centavos(d.get(ks.valor_nota)) if ks.valor_nota else 0
+            tot_bc    += _parse_centavos(d.get(ks.bc_icms)) if ks.bc_icms else 0
+            tot_icms  += _parse_centavos(d.get(ks.valor_icms)) if ks.valor_icms else 0
 
-        v_nota = _extr_decimal_by_keys(dline, CANDS_VALOR_NOTA)
-        v_bc   = _extr_decimal_by_keys(dline, CANDS_BC_ICMS)
-        v_icms = _extr_decimal_by_keys(dline, CANDS_VALOR_ICMS)
+        no_questor = not chaves_questor.isdisjoint((key_pair_raw, key_pair_dig, raw_doc, dig_doc))
+        status = str(d.get(ks.status, "")).strip().lower() if ks.status else ""
 
-        por_doc_valor[key_raw] = por_doc_valor.get(key_raw, Decimal("0")) + v_nota
-        por_doc_bc[key_raw]    = por_doc_bc.get(key_raw,    Decimal("0")) + v_bc
-        por_doc_icms[key_raw]  = por_doc_icms.get(key_raw,  Decimal("0")) + v_icms
+        if no_questor:
+            sat_considerados += 1
+            if not _is_cancelado(status):
+                continue
+            candidatos += 1
+
+            val_q = (q_pair_raw.get(key_pair_raw) or
+                     q_pair_dig.get(key_pair_dig) or
+                     q_doc_raw.get(raw_doc) or
+                     q_doc_dig.get(dig_doc))
+            if val_q is None:
+                nao_encontradas += 1
+                continue
+            pareadas += 1
+            if val_q != 0:
+                divergencias_total += 1
+                if divergencias_total > MAX_LINHAS_RESULTADO:
+                    continue
+                divergencias.append({
+                    "linha_excel": "-",
+                    "documento": num_sat,
+                    "serie": serie_sat,
+                    "data_emissao": dt_em.isoformat() if dt_em else "",
+                    "valor_questor": str(_centavos_para_decimal(val_q)),
+                    "status_sat": _status_legivel(d),
+                    "valor_sat": str(_extr_valor_total_sat(d)),
+                    "id_sat": _extr_id_sat(d),
+                    "sheet_sat": sheet,
+                    "row_sat": row,
+                })
+        elif _is_autorizado(status):
+            uniq = key_pair_raw or raw_doc or dig_doc
+            if uniq in vistos_aut:
+                continue
+            vistos_aut.add(uniq)
+            autorizadas_fora_total += 1
+            if autorizadas_fora_total > MAX_LINHAS_RESULTADO:
+                continue
+            autorizadas_fora.append({
+                "documento": num_sat,
+                "serie": serie_sat,
+                "data_emissao": dt_em.isoformat() if dt_em else "",
+                "status_sat": _status_legivel(d),
+                "valor_sat": str(_extr_valor_total_sat(d)),
+                "id_sat": _extr_id_sat(d),
+                "sheet_sat": sheet,
+                "row_sat": row,
+            })
 
     return {
-        "valor_total": sum(por_doc_valor.values(), Decimal("0")),
-        "bc_icms":     sum(por_doc_bc.values(),    Decimal("0")),
-        "valor_icms":  sum(por_doc_icms.values(),  Decimal("0")),
+        "totais": {
+            "valor_total": _centavos_para_decimal(tot_valor),
+            "bc_icms": _centavos_para_decimal(tot_bc),
+            "valor_icms": _centavos_para_decimal(tot_icms),
+        },
+        "divergencias": divergencias,
+        "divergencias_total": divergencias_total,
+        "autorizadas_fora": autorizadas_fora,
+        "autorizadas_fora_total": autorizadas_fora_total,
+        "candidatos": candidatos,
+        "pareadas": pareadas,
+        "nao_encontradas": nao_encontradas,
+        "sat_considerados": sat_considerados,
+        "sat_total_periodo": sat_total_periodo,
     }
 
-def _sat_totais_periodo(qs, dt_ini: date | None, dt_fim: date | None) -> dict:
-    tot_valor = Decimal("0"); tot_bc = Decimal("0"); tot_icms = Decimal("0")
-    vistos = set()
-    for reg in qs.iterator():
-        d = reg.data or {}
-        if dt_ini and dt_fim:
-            dt_em = _extr_data_emissao_dict(d)
-            if dt_em is None or not (dt_ini <= dt_em <= dt_fim):
-                continue
-        num_sat = _numero_documento_sat(d)
-        if not num_sat:
-            continue
-        serie_sat = d.get(_first_key(d, ["serie","serienfe","serie_nfce"]), "") or ""
-        key_pair_raw, _ = _norm_pair(num_sat, serie_sat)
-        if key_pair_raw in vistos:
-            continue
-        vistos.add(key_pair_raw)
-        v_nota = _extr_decimal_by_keys(d, CANDS_VALOR_NOTA)
-        v_bc   = _extr_decimal_by_keys(d, CANDS_BC_ICMS)
-        v_icms = _extr_decimal_by_keys(d, CANDS_VALOR_ICMS)
-        tot_valor += v_nota; tot_bc += v_bc; tot_icms += v_icms
-    return {"valor_total": tot_valor, "bc_icms": tot_bc, "valor_icms": tot_icms}
-
 @login_required
 @require_POST
 def comparar_questor(request):
@@ -630,134 +965,123 @@ def comparar_questor(request):
 
     empresa = get_object_or_404(Empresa, pk=empresa_id)
 
-    try:
-        wb_q = load_workbook(filename=arq, data_only=True, read_only=True)
-    except Exception as e:
-        messages.error(request, f"Não consegui abrir o Excel do Questor: {e}")
-        return redirect("comparar_questor_form")
+    # uma comparação com pulso recente ainda tem a thread viva: não se começa outra por cima
+    anteriores = ComparacaoQuestor.objects.filter(user=request.user)
+    vivas = Q(status=ComparacaoQuestor.Status.PROCESSANDO, updated_at__gte=timezone.now() - PRAZO_COMPARACAO)
+    viva = anteriores.filter(vivas).only("pk").first()
+    if viva:
+        request.session["questor_cmp_id"] = viva.pk
+        messages.warning(request, "Já existe uma comparação em andamento. Aguarde o resultado antes de enviar outra planilha.")
+        return redirect("comparar_questor_resultado")
+
+    # o upload temporário some ao fim da requisição; a thread lê uma cópia
+    with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as tmp:
+        for chunk in arq.chunks():
+            tmp.write(chunk)
+
+    # só o último resultado de cada usuário é consultado, os anteriores saem aqui; uma comparação
+    # viva (envio simultâneo) fica, para a thread dela não trabalhar sobre uma linha apagada
+    anteriores = anteriores.exclude(vivas)
+    for caminho in anteriores.filter(
+        status=ComparacaoQuestor.Status.PROCESSANDO,
+    ).values_list("arquivo_tmp", flat=True):
+        _descartar_tmp(caminho)
+    anteriores.delete()
+    cmp = ComparacaoQuestor.objects.create(empresa=empresa, user=request.user, arquivo_tmp=tmp.name)
+    request.session.pop("questor_cmp", None)
+    request.session["questor_cmp_id"] = cmp.pk
+    request.session["questor_cmp_aviso"] = cmp.pk
+
+    args = (cmp.pk, empresa, tmp.name, arq.name, dt_ini, dt_fim)
+    transaction.on_commit(lambda: threading.Thread(
+        target=_comparar_em_segundo_plano, args=args, name=f"questor-cmp-{cmp.pk}", daemon=True,
+    ).start())
+    return redirect("comparar_questor_resultado")
 
-    t0 = time.time()
-    ws_q = wb_q[wb_q.sheetnames[0]]
+def _comparar_em_segundo_plano(cmp_id, empresa, caminho, arquivo_nome, dt_ini, dt_fim) -> None:
+    Status = ComparacaoQuestor.Status
+    # se a comparação já foi dada por perdida (sem pulso), o resultado tardio não a sobrescreve
+    em_andamento = ComparacaoQuestor.objects.filter(pk=cmp_id, status=Status.PROCESSANDO)
+
+    def pulso():
+        em_andamento.update(updated_at=timezone.now())
 
     try:
-        (q_doc_raw, q_doc_dig, q_pair_raw, q_pair_dig), meta = _questor_map_por_documento(ws_q, dt_ini, dt_fim)
+        payload, resumo = _comparar(empresa, caminho, arquivo_nome, dt_ini, dt_fim, pulso)
     except ValueError as err:
-        messages.error(request, str(err))
-        return redirect("comparar_questor_form")
+        em_andamento.update(status=Status.ERRO, mensagem=str(err), arquivo_tmp="", updated_at=timezone.now())
+    except Exception as e:
+        print(f"[ERRO comparar_questor] {type(e).__name__}: {e}")
+        em_andamento.update(
+            status=Status.ERRO, mensagem=f"Falha ao processar a comparação: {type(e).__name__}: {e}",
+            arquivo_tmp="", updated_at=timezone.now(),
+        )
+    else:
+        em_andamento.update(
+            status=Status.CONCLUIDA, payload=payload, mensagem=resumo,
+            arquivo_tmp="", updated_at=timezone.now(),
+        )
+    finally:
+        _descartar_tmp(caminho)
+        # a conexão é desta thread, que termina aqui
+        connection.close()
+
+def _comparar(empresa, caminho, arquivo_nome, dt_ini, dt_fim, pulso=None):
+    """Corpo da comparação; devolve (payload, resumo). ValueError = mensagem para o usuário.
+    `pulso`, se dado, é chamado periodicamente enquanto as planilhas e o SAT são lidos."""
+    try:
+        wb_q = load_workbook(filename=caminho, data_only=True, read_only=True)
+    except Exception as e:
+        raise ValueError(f"Não consegui abrir o Excel do Questor: {e}")
 
+    t0 = time.time()
     ws_q = wb_q[wb_q.sheetnames[0]]
-    totais_questor = _questor_totais_periodo(ws_q, dt_ini, dt_fim)
-
-    set_pair_raw = set(q_pair_raw.keys())
-    set_pair_dig = set(q_pair_dig.keys())
-    set_doc_raw  = set(q_doc_raw.keys())
-    set_doc_dig  = set(q_doc_dig.keys())
-
-    if not (set_pair_raw or set_pair_dig or set_doc_raw or set_doc_dig):
-        messages.warning(request, "A planilha do Questor não trouxe nenhum Documento legível para pareamento no período.")
-        return redirect("comparar_questor_form")
-
-    qs_sat = SatRegistro.objects.filter(empresa=empresa).only("data","sheet","row")
-    qs_sat_tot = SatRegistro.objects.filter(empresa=empresa).only("data")
-    totais_sat = _sat_totais_periodo(qs_sat_tot, dt_ini, dt_fim)
-    divergencias = []
-    candidatos = pareadas = nao_encontradas = 0
-    sat_considerados = 0
-    sat_total_periodo = 0
-
-    for reg in qs_sat.iterator():
-        d = reg.data or {}
-        dt_em = _extr_data_emissao_dict(d)
-        if dt_ini and dt_fim:
-            if dt_em is None or not (dt_ini <= dt_em <= dt_fim):
-                continue
-        sat_total_periodo += 1
-        num_sat = _numero_documento_sat(d)
-        if not num_sat:
-            continue
-        serie_sat = d.get(_first_key(d, ["serie","serienfe","serie_nfce"]), "") or ""
-        raw_doc, dig_doc = _norm_doc(num_sat)
-        key_pair_raw, key_pair_dig = _norm_pair(num_sat, serie_sat)
-        if not ((key_pair_raw and key_pair_raw in set_pair_raw) or
-                (key_pair_dig and key_pair_dig in set_pair_dig) or
-                (raw_doc and raw_doc in set_doc_raw) or
-                (dig_doc and dig_doc in set_doc_dig)):
-            continue
-        sat_considerados += 1
-        status = _extr_status_sat(d)
-        if not _is_cancelado(status):
-            continue
-        candidatos += 1
-
-        val_q = (q_pair_raw.get(key_pair_raw) or
-                 q_pair_dig.get(key_pair_dig) or
-                 q_doc_raw.get(raw_doc) or
-                 q_doc_dig.get(dig_doc))
-        if val_q is None:
-            nao_encontradas += 1
-            continue
-        pareadas += 1
-        if Decimal(val_q) != 0:
-            divergencias.append({
-                "linha_excel": "-",
-                "documento": num_sat,
-                "serie": serie_sat,
-                "data_emissao": dt_em.isoformat() if dt_em else "",
-                "valor_questor": str(val_q),
-                "status_sat": _status_legivel(d),
-                "valor_sat": str(_extr_valor_total_sat(d)),
-                "id_sat": _extr_id_sat(d),
-                "sheet_sat": reg.sheet,
-                "row_sat": reg.row,
-            })
 
-    autorizadas_fora = []
-    vistos_aut = set()
-    for reg in qs_sat.iterator():
-        d = reg.data or {}
-        dt_em = _extr_data_emissao_dict(d)
-        if dt_ini and dt_fim:
-            if dt_em is None or not (dt_ini <= dt_em <= dt_fim):
-                continue
-        num_sat = _numero_documento_sat(d)
-        if not num_sat:
-            continue
-        serie_sat = d.get(_first_key(d, ["serie","serienfe","serie_nfce"]), "") or ""
-        raw_doc, dig_doc = _norm_doc(num_sat)
-        key_pair_raw, key_pair_dig = _norm_pair(num_sat, serie_sat)
-        status = _extr_status_sat(d)
-        if not _is_autorizado(status):
-            continue
-        if ((key_pair_raw and key_pair_raw in set_pair_raw) or
-            (key_pair_dig and key_pair_dig in set_pair_dig) or
-            (raw_doc and raw_doc in set_doc_raw) or
-            (dig_doc and dig_doc in set_doc_dig)):
-            continue
-        uniq = key_pair_raw or raw_doc or dig_doc
-        if uniq in vistos_aut:
-            continue
-        vistos_aut.add(uniq)
-        autorizadas_fora.append({
-            "documento": num_sat,
-            "serie": serie_sat,
-            "data_emissao": dt_em.isoformat() if dt_em else "",
-            "status_sat": _status_legivel(d),
-            "valor_sat": str(_extr_valor_total_sat(d)),
-            "id_sat": _extr_id_sat(d),
-            "sheet_sat": reg.sheet,
-            "row_sat": reg.row,
-        })
+    try:
+        (q_doc_raw, q_doc_dig, q_pair_raw, q_pair_dig), totais_questor, meta = _ler_questor(
+            _com_pulso(ws_q.iter_rows(values_only=True), pulso), dt_ini, dt_fim
+        )
+    finally:
+        # em read_only o openpyxl mantém o arquivo aberto até close()
+        wb_q.close()
+
+    # chaves par ("num|serie") e documento não colidem, e a forma só-dígitos é idempotente:
+    # um conjunto único responde às quatro perguntas de antes
+    chaves_questor = set().union(q_pair_raw, q_pair_dig, q_doc_raw, q_doc_dig)
+    chaves_questor.discard("")
+
+    if not chaves_questor:
+        raise ValueError("A planilha do Questor não trouxe nenhum Documento legível para pareamento no período.")
+
+    qs_sat = SatRegistro.objects.filter(empresa=empresa)
+    if dt_ini and dt_fim:
+        # data_emissao é gravada pelo importador com a mesma regra de _extr_data_emissao_dict e
+        # usa o índice (empresa, data_emissao); linhas sem a coluna (importações antigas) seguem
+        # para o filtro em Python, que continua valendo
+        qs_sat = qs_sat.filter(Q(data_emissao__range=(dt_ini, dt_fim)) | Q(data_emissao__isnull=True))
+    qs_sat = qs_sat.values_list("data", "sheet", "row")
+    sat = _varrer_sat(
+        qs_sat, dt_ini, dt_fim,
+        (q_doc_raw, q_doc_dig, q_pair_raw, q_pair_dig),
+        chaves_questor,
+        pulso,
+    )
+    totais_sat = sat["totais"]
+    divergencias = sat["divergencias"]
+    autorizadas_fora = sat["autorizadas_fora"]
+    candidatos, pareadas, nao_encontradas = sat["candidatos"], sat["pareadas"], sat["nao_encontradas"]
+    sat_considerados, sat_total_periodo = sat["sat_considerados"], sat["sat_total_periodo"]
 
     duracao = round(time.time() - t0, 2)
-    request.session["questor_cmp"] = {
+    payload = {
         "empresa_id": empresa.id,
-        "arquivo_nome": arq.name,
+        "arquivo_nome": arquivo_nome,
         "linhas_lidas": meta["linhas_lidas_periodo"],
         "pareadas": pareadas,
         "nao_encontradas": nao_encontradas,
         "candidatos_cancelados": candidatos,
         "duracao": duracao,
-        "resultado": divergencias[:20000],
+        "resultado": divergencias,
         "meta": meta,
         "sat_linhas_periodo": sat_total_periodo,
         "questor_linhas_periodo": meta["linhas_lidas_periodo"],
@@ -766,206 +1090,193 @@ def comparar_questor(request):
         "fim": dt_fim.isoformat() if dt_fim else "",
         "totais_questor": {k: str(v) for k, v in (totais_questor or {}).items()},
         "totais_sat": {k: str(v) for k, v in (totais_sat or {}).items()},
-        "sat_autorizadas_fora": autorizadas_fora[:20000],
-        "sat_autorizadas_fora_total": len(autorizadas_fora),
+        "sat_autorizadas_fora": autorizadas_fora,
+        "sat_autorizadas_fora_total": sat["autorizadas_fora_total"],
     }
-
-    messages.success(
-        request,
+    resumo = (
         f"Período: {dt_ini or '—'} a {dt_fim or '—'} • "
         f"SAT no período: {sat_total_periodo} • Presentes no Questor: {sat_considerados} • "
         f"Canceladas: {candidatos} • Pareadas: {pareadas} • Não encontradas: {nao_encontradas} • "
-        f"Divergências (valor>0): {len(divergencias)} • "
-        f"SAT autorizadas fora do Questor: {len(autorizadas_fora)}."
+        f"Divergências (valor>0): {sat['divergencias_total']} • "
+        f"SAT autorizadas fora do Questor: {sat['autorizadas_fora_total']}."
     )
-    return redirect("comparar_questor_resultado")
+    return payload, resumo
+
+# estilos da exportação: objetos imutáveis do openpyxl, compartilhados entre requisições
+_HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+_HEADER_FONT = Font(bold=True, color="FFFFFF")
+_SUBHEADER_FILL = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
+_SUBHEADER_FONT = Font(bold=True)
+_CENTER_ALIGN = Alignment(horizontal="center", vertical="center")
+_STATUS_CANCEL_FILL = PatternFill(start_color="F8D7DA", end_color="F8D7DA", fill_type="solid")
+_STATUS_OK_FILL     = PatternFill(start_color="D1E7DD", end_color="D1E7DD", fill_type="solid")
+_TITULO_FONT = Font(bold=True, size=14)
+_SECAO_FONT = Font(bold=True, size=12)
+
+def _cel(ws, valor, **estilo):
+    c = WriteOnlyCell(ws, value=valor)
+    for k, v in estilo.items():
+        setattr(c, k, v)
+    return c
+
+def _medir(max_len, linha):
+    # em write_only as larguras vão no cabeçalho da aba, antes das linhas: mede-se numa passada
+    # própria, sem guardar as linhas
+    for col_idx, v in enumerate(linha, 1):
+        if isinstance(v, Cell):
+            v = v.value
+        if v is None:
+            continue
+        n = 10 if isinstance(v, (datetime, date)) else len(str(v))  # dd/mm/aaaa
+        if n > max_len.get(col_idx, 0):
+            max_len[col_idx] = min(n, 200)
+
+def _valores_divergencia(e) -> list:
+    return [
+        e.get("documento",""), e.get("serie",""),
+        _parse_date_any(e.get("data_emissao","")),
+        _parse_money_float(e.get("valor_questor","0")),
+        e.get("status_sat",""),
+        _parse_money_float(e.get("valor_sat","0")),
+        e.get("id_sat",""), e.get("sheet_sat",""), e.get("row_sat",""),
+    ]
+
+def _celulas_divergencia(ws, valores) -> list:
+    documento, serie, dt, valor_questor, status, valor_sat, id_sat, sheet, row = valores
+    st = str(status or "").upper()
+    if st == "CANCELADA":
+        status = _cel(ws, status, fill=_STATUS_CANCEL_FILL)
+    elif st == "AUTORIZADA":
+        status = _cel(ws, status, fill=_STATUS_OK_FILL)
+    return [
+        documento, serie,
+        _cel(ws, dt, number_format="dd/mm/yyyy"),
+        _cel(ws, valor_questor, number_format="#,##0.00"),
+        status,
+        _cel(ws, valor_sat, number_format="#,##0.00"),
+        id_sat, sheet, row,
+    ]
+
+def _valores_autorizada(e) -> list:
+    return [
+        e.get("documento",""),
+        e.get("serie",""),
+        _parse_date_any(e.get("data_emissao","")),
+        e.get("status_sat",""),
+        _parse_money_float(e.get("valor_sat","0")),
+        e.get("id_sat",""),
+        e.get("sheet_sat",""),
+        e.get("row_sat",""),
+    ]
+
+def _celulas_autorizada(ws, valores) -> list:
+    documento, serie, dt, status, valor_sat, id_sat, sheet, row = valores
+    if str(status or "").upper() == "AUTORIZADA":
+        status = _cel(ws, status, fill=_STATUS_OK_FILL)
+    return [
+        documento, serie,
+        _cel(ws, dt, number_format="dd/mm/yyyy"),
+        status,
+        _cel(ws, valor_sat, number_format="#,##0.00"),
+        id_sat, sheet, row,
+    ]
+
+def _larguras(ws, max_len, min_w=9, max_w=80):
+    for col_idx in range(1, max(max_len, default=0) + 1):
+        letter = get_column_letter(col_idx)
+        ws.column_dimensions[letter].width = max(min_w, min(int(max_len.get(col_idx, 0) * 1.15), max_w))
 
 @login_required
 def comparar_questor_csv(request):
-    data = request.session.get("questor_cmp")
-    if not data:
+    cmp = _comparacao_da_sessao(request)
+    if not cmp or cmp.status != ComparacaoQuestor.Status.CONCLUIDA:
         messages.error(request, "Nenhum resultado de comparação encontrado na sessão.")
         return redirect("comparar_questor_form")
 
+    data = cmp.payload
+
     empresa = get_object_or_404(Empresa, pk=data["empresa_id"])
     rows = data.get("resultado", []) or []
     sat_aut = data.get("sat_autorizadas_fora", []) or []
 
-    def _autofit(ws, min_w=9, max_w=80):
-        for col_idx in range(1, ws.max_column + 1):
-            letter = get_column_letter(col_idx)
-            max_len = 0
-            for cell in ws[letter]:
-                v = cell.value
-                if v is None:
-                    continue
-                if isinstance(v, (datetime, date)):
-                    s = v.strftime("%d/%m/%Y")
-                else:
-                    s = str(v)
-                if len(s) > 200:
-                    s = s[:200]
-                max_len = max(max_len, len(s))
-                cell.alignment = Alignment(wrap_text=False, vertical="center")
-            ws.column_dimensions[letter].width = max(min_w, min(int(max_len * 1.15), max_w))
-
-    def _to_dec(x):
-        try:
-            s = str(x).replace(".", "").replace(",", ".")
-            return float(Decimal(s))
-        except Exception:
-            try:
-                return float(Decimal(str(x)))
-            except Exception:
-                return 0.0
-
-    def _to_date(x):
-        return _parse_date_any(x)
-
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    subheader_fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-    subheader_font = Font(bold=True)
-    center_align = Alignment(horizontal="center", vertical="center")
-    status_cancel_fill = PatternFill(start_color="F8D7DA", end_color="F8D7DA", fill_type="solid")
-    status_ok_fill     = PatternFill(start_color="D1E7DD", end_color="D1E7DD", fill_type="solid")
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Divergências"
-    ws.append(["RESUMO DA ANÁLISE"])
-    ws["A1"].font = Font(bold=True, size=14)
-    ws.append(["Empresa", empresa.nome])
-    ws.append(["CNPJ", empresa.cnpj])
-    ws.append(["Arquivo Questor", data.get("arquivo_nome")])
-    ws.append(["Período Início", data.get("inicio") or "—"])
-    ws.append(["Período Fim", data.get("fim") or "—"])
-    ws.append([])
-    ws.append(["ESTATÍSTICAS"])
-    ws[f"A{ws.max_row}"].font = Font(bold=True, size=12)
-    ws.append(["Total SAT no período", data.get("sat_linhas_periodo")])
-    ws.append(["Total Questor no período", data.get("questor_linhas_periodo")])
-    ws.append(["SAT presentes no Questor", data.get("sat_considerados")])
-    ws.append(["Canceladas no SAT", data.get("candidatos_cancelados")])
-    ws.append(["Pareadas", data.get("pareadas")])
-    ws.append(["Não encontradas", data.get("nao_encontradas")])
-    ws.append(["❌ Divergências (valor>0)", len(rows)])
-    ws.append(["SAT autorizadas fora do Questor", data.get("sat_autorizadas_fora_total", 0)])
-    ws.append(["Tempo processamento (s)", data.get("duracao")])
-    ws.append([])
+    # write_only: as linhas vão direto para o arquivo, sem manter a planilha inteira em memória
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Divergências")
 
     tq = data.get("totais_questor", {}) or {}
     ts = data.get("totais_sat", {}) or {}
-    ws.append(["TOTAIS NO PERÍODO"])
-    ws[f"A{ws.max_row}"].font = Font(bold=True, size=12)
-
-    header_row = ws.max_row + 1
-    ws.append(["", "Valor total notas", "BC ICMS", "Valor ICMS"])
-    for col in range(1, 5):
-        cell = ws.cell(row=header_row, column=col)
-        cell.fill = subheader_fill
-        cell.font = subheader_font
-        cell.alignment = center_align
-
-    ws.append(["Questor", _to_dec(tq.get("valor_total","0")), _to_dec(tq.get("bc_icms","0")), _to_dec(tq.get("valor_icms","0"))])
-    ws.append(["SAT",     _to_dec(ts.get("valor_total","0")), _to_dec(ts.get("bc_icms","0")), _to_dec(ts.get("valor_icms","0"))])
-    for r in (header_row+1, header_row+2):
-        for c in ("B","C","D"):
-            ws[f"{c}{r}"].number_format = "#,##0.00"
-
-    ws.append([])
-
-    ws.append(["DIVERGÊNCIAS - NFC-e CANCELADAS COM VALOR CONTÁBIL"])
-    ws[f"A{ws.max_row}"].font = Font(bold=True, size=12)
-
-    header_row = ws.max_row + 1
-    ws.append([
-        "Número Documento", "Série", "Data Emissão", "Valor Contábil Questor",
-        "Status SAT", "Valor Total SAT", "ID SAT", "Aba SAT", "Linha SAT"
+    # resumo e cabeçalho têm tamanho fixo; as linhas de dados são montadas duas vezes (medir e
+    # gravar) a partir do payload, sem ficar em memória
+    cabecalho = [
+        [_cel(ws, "RESUMO DA ANÁLISE", font=_TITULO_FONT)],
+        ["Empresa", empresa.nome],
+        ["CNPJ", empresa.cnpj],
+        ["Arquivo Questor", data.get("arquivo_nome")],
+        ["Período Início", data.get("inicio") or "—"],
+        ["Período Fim", data.get("fim") or "—"],
+        [],
+        [_cel(ws, "ESTATÍSTICAS", font=_SECAO_FONT)],
+        ["Total SAT no período", data.get("sat_linhas_periodo")],
+        ["Total Questor no período", data.get("questor_linhas_periodo")],
+        ["SAT presentes no Questor", data.get("sat_considerados")],
+        ["Canceladas no SAT", data.get("candidatos_cancelados")],
+        ["Pareadas", data.get("pareadas")],
+        ["Não encontradas", data.get("nao_encontradas")],
+        ["❌ Divergências (valor>0)", len(rows)],
+        ["SAT autorizadas fora do Questor", data.get("sat_autorizadas_fora_total", 0)],
+        ["Tempo processamento (s)", data.get("duracao")],
+        [],
+        [_cel(ws, "TOTAIS NO PERÍODO", font=_SECAO_FONT)],
+        [_cel(ws, v, fill=_SUBHEADER_FILL, font=_SUBHEADER_FONT, alignment=_CENTER_ALIGN)
+         for v in ("", "Valor total notas", "BC ICMS", "Valor ICMS")],
+    ]
+    for rotulo, tot in (("Questor", tq), ("SAT", ts)):
+        cabecalho.append([rotulo] + [
+            _cel(ws, _parse_money_float(tot.get(k, "0")), number_format="#,##0.00")
+            for k in ("valor_total", "bc_icms", "valor_icms")
+        ])
+    cabecalho.append([])
+    cabecalho.append([_cel(ws, "DIVERGÊNCIAS - NFC-e CANCELADAS COM VALOR CONTÁBIL", font=_SECAO_FONT)])
+    cabecalho.append([
+        _cel(ws, v, fill=_HEADER_FILL, font=_HEADER_FONT, alignment=_CENTER_ALIGN)
+        for v in ("Número Documento", "Série", "Data Emissão", "Valor Contábil Questor",
+                  "Status SAT", "Valor Total SAT", "ID SAT", "Aba SAT", "Linha SAT")
     ])
-    for col in range(1, 10):
-        cell = ws.cell(row=header_row, column=col)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = center_align
+    header_row = len(cabecalho)
 
+    max_len = {}
+    for linha in cabecalho:
+        _medir(max_len, linha)
     for e in rows:
-        dt = _to_date(e.get("data_emissao",""))
-        ws.append([
-            e.get("documento",""), e.get("serie",""), dt,
-            _to_dec(e.get("valor_questor","0")),
-            e.get("status_sat",""), _to_dec(e.get("valor_sat","0")),
-            e.get("id_sat",""), e.get("sheet_sat",""), e.get("row_sat","")
-        ])
-        rix = ws.max_row
-        st = str(ws.cell(row=rix, column=5).value or "").upper()
-        if st == "CANCELADA":
-            ws.cell(row=rix, column=5).fill = status_cancel_fill
-        elif st == "AUTORIZADA":
-            ws.cell(row=rix, column=5).fill = status_ok_fill
-
-    for cell in ws.iter_cols(min_col=3, max_col=3, min_row=header_row+1, max_row=ws.max_row):
-        for c in cell: c.number_format = "dd/mm/yyyy"
-    for cell in ws.iter_cols(min_col=4, max_col=4, min_row=header_row+1, max_row=ws.max_row):
-        for c in cell: c.number_format = "#,##0.00"
-    for cell in ws.iter_cols(min_col=6, max_col=6, min_row=header_row+1, max_row=ws.max_row):
-        for c in cell: c.number_format = "#,##0.00"
-
-    ws.auto_filter.ref = f"A{header_row}:I{ws.max_row}"
+        _medir(max_len, _valores_divergencia(e))
+
+    ws.auto_filter.ref = f"A{header_row}:I{header_row + len(rows)}"
     ws.freeze_panes = f"A{header_row+1}"
-    def _autofit(ws, min_w=9, max_w=80):
-        for col_idx in range(1, ws.max_column + 1):
-            letter = get_column_letter(col_idx)
-            max_len = 0
-            for cell in ws[letter]:
-                v = cell.value
-                if v is None:
-                    continue
-                if isinstance(v, (datetime, date)):
-                    s = v.strftime("%d/%m/%Y")
-                else:
-                    s = str(v)
-                if len(s) > 200:
-                    s = s[:200]
-                max_len = max(max_len, len(s))
-                cell.alignment = Alignment(wrap_text=False, vertical="center")
-            ws.column_dimensions[letter].width = max(min_w, min(int(max_len * 1.15), max_w))
-    _autofit(ws)
+    _larguras(ws, max_len)
     ws.column_dimensions['G'].width = max(ws.column_dimensions['G'].width or 0, 52)
-    ws2 = wb.create_sheet("SAT autorizadas fora")
-    header_row2 = 1
-    ws2.append(["Número Documento","Série","Data Emissão","Status SAT",
-                "Valor Total SAT","ID SAT","Aba SAT","Linha SAT"])
-    for col in range(1, 9):
-        cell = ws2.cell(row=header_row2, column=col)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = center_align
+    for linha in cabecalho:
+        ws.append(linha)
+    for e in rows:
+        ws.append(_celulas_divergencia(ws, _valores_divergencia(e)))
 
+    ws2 = wb.create_sheet("SAT autorizadas fora")
+    titulos = [
+        _cel(ws2, v, fill=_HEADER_FILL, font=_HEADER_FONT, alignment=_CENTER_ALIGN)
+        for v in ("Número Documento","Série","Data Emissão","Status SAT",
+                  "Valor Total SAT","ID SAT","Aba SAT","Linha SAT")
+    ]
+    max_len = {}
+    _medir(max_len, titulos)
     for e in sat_aut:
-        ws2.append([
-            e.get("documento",""),
-            e.get("serie",""),
-            _to_date(e.get("data_emissao","")),
-            e.get("status_sat",""),
-            _to_dec(e.get("valor_sat","0")),
-            e.get("id_sat",""),
-            e.get("sheet_sat",""),
-            e.get("row_sat",""),
-        ])
-        rix = ws2.max_row
-        st = str(ws2.cell(row=rix, column=4).value or "").upper()
-        if st == "AUTORIZADA":
-            ws2.cell(row=rix, column=4).fill = status_ok_fill
-
-    for cell in ws2.iter_cols(min_col=3, max_col=3, min_row=2, max_row=ws2.max_row):
-        for c in cell: c.number_format = "dd/mm/yyyy"
-    for cell in ws2.iter_cols(min_col=5, max_col=5, min_row=2, max_row=ws2.max_row):
-        for c in cell: c.number_format = "#,##0.00"
+        _medir(max_len, _valores_autorizada(e))
 
-    ws2.auto_filter.ref = f"A1:H{ws2.max_row}"
+    ws2.auto_filter.ref = f"A1:H{1 + len(sat_aut)}"
     ws2.freeze_panes = "A2"
-    _autofit(ws2)
+    _larguras(ws2, max_len)
     ws2.column_dimensions['F'].width = max(ws2.column_dimensions['F'].width or 0, 52)
+    ws2.append(titulos)
+    for e in sat_aut:
+        ws2.append(_celulas_autorizada(ws2, _valores_autorizada(e)))
 
     resp = HttpResponse(
         content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
@@ -103,6 +103,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = 'login'
 LOGOUT_REDIRECT_URL = 'login'
+# Ligue só se houver um backend de autenticação que aceite authenticate(email=..., password=...)
+AUTH_BACKEND_EMAIL = config('AUTH_BACKEND_EMAIL', default=False, cast=bool)
 
 CSRF_TRUSTED_ORIGINS = [
     'https://comparacaosatquestor-production.up.railway.app' 